@@ -0,0 +1,382 @@
+"""Offline benchmark for the bot's handlers against a local fake Telegram Bot API.
+
+Runs the real handlers from mrsb.py inside a temporary working directory, feeds
+them synthetic update streams through the dispatcher and reports p50/p99
+latency and throughput. Nothing touches the network, so it can run in CI: it
+exits non-zero when a handler logs an error or a broadcast misses or repeats a
+recipient.
+
+    python bench.py
+    python bench.py --updates 500 --broadcast-users 10000 --json
+    python bench.py --webhook    # push updates through the webhook server
+"""
+import argparse
+import email
+import glob
+import itertools
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BOT_TOKEN = '123456:bench'
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+FIRST_USER_ID = 10_000_000
+WEBHOOK_SECRET = 'bench-secret'
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    """Answers Bot API calls with minimal valid results and records them per chat."""
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; without this, delayed ACKs add ~40ms per call
+    disable_nagle_algorithm = True
+
+    def do_POST(self) -> None:
+        method = self.path.rsplit('/', 1)[-1]
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        params = self._parse(body)
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        chat_id = params.get('chat_id')
+        server.record(method, chat_id)
+        if str(chat_id) in server.blocked:
+            self._reply(403, {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'})
+            return
+        self._reply(200, {'ok': True, 'result': server.result(method, params)})
+
+    def _parse(self, body: bytes) -> dict:
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('multipart/form-data'):
+            message = email.message_from_bytes(f'Content-Type: {content_type}\r\n\r\n'.encode() + body)
+            params = {}
+            for part in message.get_payload():
+                name = part.get_param('name', header='content-disposition')
+                params[name] = part.get_payload(decode=True) if part.get_filename() else part.get_payload()
+            return params
+        return json.loads(body) if body else {}
+
+    def _reply(self, status: int, payload: dict) -> None:
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class FakeTelegramServer(ThreadingHTTPServer):
+    """Local stand-in for api.telegram.org."""
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, latency: float = 0.0) -> None:
+        super().__init__(('127.0.0.1', 0), FakeApiHandler)
+        self.latency = latency
+        self.blocked = set()
+        self.calls = {}
+        self.last_call = {}
+        self.messages_to = {}  # chat ID -> sendMessage calls
+        self.message_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}/bot'
+
+    def start(self) -> None:
+        threading.Thread(target=self.serve_forever, name='fake-telegram', daemon=True).start()
+
+    def record(self, method: str, chat_id) -> None:
+        now = time.perf_counter()
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            if chat_id is not None:
+                self.last_call[str(chat_id)] = now
+                if method == 'sendMessage':
+                    self.messages_to[str(chat_id)] = self.messages_to.get(str(chat_id), 0) + 1
+
+    def result(self, method: str, params: dict):
+        if method == 'getMe':
+            return BOT_USER
+        if method in ('getUpdates',):
+            return []
+        if method in ('sendMessage', 'editMessageText', 'sendPhoto', 'sendDocument'):
+            chat_id = int(params.get('chat_id') or 0)
+            message = {
+                'message_id': params.get('message_id') or next(self.message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': params.get('text', ''),
+            }
+            if method == 'sendDocument':
+                message['document'] = {'file_id': f'doc-{next(self.message_ids)}', 'file_unique_id': 'u'}
+            return message
+        return True
+
+
+class ErrorCounter(logging.Handler):
+    """Counts error records, so a handler that fails makes the run fail."""
+    def __init__(self) -> None:
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append(record.getMessage())
+
+
+def message_update(update_id: int, user_id: int, text: str) -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'}
+    entities = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}] if text.startswith('/') else []
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': user,
+            'text': text,
+            'entities': entities,
+        },
+    }
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'}
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': user,
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': 'menu',
+            },
+        },
+    }
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Bench:
+    def __init__(self, mrsb, server: FakeTelegramServer, updater, webhook_url: str = None) -> None:
+        self.mrsb = mrsb
+        self.server = server
+        self.updater = updater
+        self.webhook_url = webhook_url
+        self.update_ids = itertools.count(1)
+        self.user_ids = itertools.count(FIRST_USER_ID)
+        self.results = []
+        self.failures = []
+
+    def wait_idle(self, timeout: float = 300) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.updater.update_queue.empty() and self.mrsb.HANDLER_POOL.depth == 0:
+                return
+            time.sleep(0.005)
+        raise TimeoutError("handlers did not finish in time")
+
+    def push(self, data: dict) -> None:
+        """Deliver an update the way Telegram would: through the webhook if enabled, else the update queue."""
+        if self.webhook_url:
+            request = urllib.request.Request(
+                self.webhook_url,
+                data=json.dumps(data).encode(),
+                headers={'Content-Type': 'application/json', SECRET_TOKEN_HEADER: WEBHOOK_SECRET},
+            )
+            urllib.request.urlopen(request).close()
+        else:
+            self.updater.update_queue.put(self.mrsb.Update.de_json(data, self.updater.bot))
+
+    def run_updates(self, name: str, updates: list) -> None:
+        """Push updates through the dispatcher and time each one until its chat's last API call."""
+        submitted = {}
+        start = time.perf_counter()
+        for chat_id, data in updates:
+            submitted[str(chat_id)] = time.perf_counter()
+            self.push(data)
+        self.wait_idle()
+        end = time.perf_counter()
+        with self.server.lock:
+            latencies = [self.server.last_call[chat] - sent for chat, sent in submitted.items()
+                         if self.server.last_call.get(chat, 0) >= sent]
+        self.report(name, len(updates), end - start, latencies)
+
+    def report(self, name: str, count: int, elapsed: float, latencies: list) -> None:
+        result = {
+            'scenario': name,
+            'count': count,
+            'seconds': round(elapsed, 3),
+            'throughput': round(count / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        }
+        self.results.append(result)
+
+    def start_burst(self, name: str, user_ids: list) -> None:
+        updates = [(user_id, message_update(next(self.update_ids), user_id, '/start')) for user_id in user_ids]
+        self.run_updates(name, updates)
+
+    def command_burst(self, name: str, text: str, count: int) -> None:
+        updates = []
+        for _ in range(count):
+            user_id = next(self.user_ids)
+            updates.append((user_id, message_update(next(self.update_ids), user_id, text)))
+        self.run_updates(name, updates)
+
+    def menu_burst(self, count: int) -> None:
+        routes = ['show_config', 'pakya', 'rng', 'dani', 'show_trusted_sellers', 'back_to_menu']
+        updates = []
+        for i in range(count):
+            user_id = next(self.user_ids)
+            updates.append((user_id, callback_update(next(self.update_ids), user_id, routes[i % len(routes)])))
+        self.run_updates('menu', updates)
+
+    def update_config(self, count: int) -> None:
+        # Every update comes from the same admin chat, so they run one after another
+        admin_id = self.mrsb.ADMINS[0]
+        latencies = []
+        start = time.perf_counter()
+        for i in range(count):
+            data = message_update(next(self.update_ids), admin_id, f'/update_config bench config {i}')
+            sent = time.perf_counter()
+            self.push(data)
+            self.wait_idle()
+            latencies.append(self.server.last_call[str(admin_id)] - sent)
+        self.report('update_config', count, time.perf_counter() - start, latencies)
+
+    def broadcast(self, users: int, rate: float) -> None:
+        from broadcaster import TokenBucket
+        mrsb = self.mrsb
+        store = mrsb.USER_STORE
+        now = time.time()
+        user_ids = [str(FIRST_USER_ID * 10 + i) for i in range(users)]
+        with store.lock, store.conn:
+            store.conn.executemany(
+                "INSERT OR IGNORE INTO users (user_id, first_seen, last_seen) VALUES (?, ?, ?)",
+                ((user_id, now, now) for user_id in user_ids),
+            )
+            store.last_seen.update(dict.fromkeys(user_ids, now))
+        mrsb.BROADCASTER.bucket = TokenBucket(rate)
+        audience = set(mrsb.load_user_ids())
+        with self.server.lock:
+            messages_before = dict(self.server.messages_to)
+        admin_id = mrsb.ADMINS[0]
+        data = message_update(next(self.update_ids), admin_id, '/broadcast bench broadcast')
+        start = time.perf_counter()
+        self.push(data)
+        self.wait_idle()
+        while mrsb.RUNNING_JOBS:
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        with self.server.lock:
+            received = {chat: self.server.messages_to.get(chat, 0) - messages_before.get(chat, 0) for chat in audience}
+        missed = sum(1 for count in received.values() if count == 0)
+        repeated = sum(1 for count in received.values() if count > 1)
+        if missed or repeated:
+            self.failures.append(
+                f"broadcast to {len(audience)} users: {missed} missed, {repeated} received it more than once"
+            )
+        # Individual sends are not timed here, so only throughput is reported
+        self.report('broadcast', sum(received.values()), elapsed, None)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=2000, help="updates per burst scenario")
+    parser.add_argument('--config-updates', type=int, default=50, help="sequential /update_config calls")
+    parser.add_argument('--broadcast-users', type=int, default=100_000, help="audience size for the broadcast")
+    parser.add_argument('--broadcast-rate', type=float, default=100_000, help="global send rate for the broadcast")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="seconds the fake API waits per call")
+    parser.add_argument('--webhook', action='store_true', help="push updates through the webhook server")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+
+    # mrsb keeps its data files in the working directory, so run on copies
+    source_dir = os.path.dirname(os.path.abspath(__file__))
+    work_dir = tempfile.mkdtemp(prefix='bench-')
+    for path in glob.glob(os.path.join(source_dir, '*.txt')):
+        if os.path.basename(path) != 'user_ids.txt':
+            shutil.copy(path, work_dir)
+    os.chdir(work_dir)
+    sys.path.insert(0, source_dir)
+
+    server = FakeTelegramServer(latency=args.api_latency)
+    server.start()
+    errors = ErrorCounter()
+    try:
+        import mrsb
+        logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger().addHandler(errors)
+        from telegram.ext import Updater
+        from telegram.utils.request import Request
+
+        bot = mrsb.MeteredBot(
+            BOT_TOKEN,
+            base_url=server.base_url,
+            request=Request(con_pool_size=mrsb.HANDLER_WORKERS + mrsb.BROADCAST_WORKERS + 8),
+        )
+        updater = Updater(bot=bot)
+        mrsb.register_handlers(updater.dispatcher)
+        threading.Thread(target=updater.dispatcher.start, name='dispatcher', daemon=True).start()
+
+        webhook_url = None
+        if args.webhook:
+            webhook = mrsb.WebhookServer(bot, updater.update_queue, '127.0.0.1', 0, '/telegram', WEBHOOK_SECRET)
+            webhook.start()
+            webhook_url = f'http://127.0.0.1:{webhook.server_address[1]}/telegram'
+
+        bench = Bench(mrsb, server, updater, webhook_url)
+        new_users = [next(bench.user_ids) for _ in range(args.updates)]
+        bench.start_burst('start_new', new_users)
+        bench.start_burst('start_again', new_users)
+        bench.command_burst('config', '/config', args.updates)
+        bench.menu_burst(args.updates)
+        bench.update_config(args.config_updates)
+        if args.broadcast_users:
+            bench.broadcast(args.broadcast_users, args.broadcast_rate)
+        updater.dispatcher.stop()
+    finally:
+        server.shutdown()
+        os.chdir(source_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(bench.results, indent=2))
+    else:
+        print(f"{'scenario':<15}{'count':>8}{'seconds':>10}{'per sec':>10}{'p50 ms':>10}{'p99 ms':>10}")
+        for result in bench.results:
+            p50 = '-' if result['p50_ms'] is None else result['p50_ms']
+            p99 = '-' if result['p99_ms'] is None else result['p99_ms']
+            print(f"{result['scenario']:<15}{result['count']:>8}{result['seconds']:>10}"
+                  f"{result['throughput']:>10}{p50:>10}{p99:>10}")
+    failures = bench.failures + [f"error logged: {message}" for message in errors.messages]
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,224 @@
+import logging
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+from telegram.error import RetryAfter
+
+logger = logging.getLogger("WarpGeneratorNG")
+
+# Telegram allows roughly 30 messages per second in total and 1 per second per chat
+GLOBAL_RATE = 25
+PER_CHAT_INTERVAL = 1.0
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every sender."""
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Drain the bucket and refuse tokens for the given number of seconds."""
+        with self.lock:
+            self.tokens = 0
+            self.updated = max(self.updated, time.monotonic() + seconds)
+
+    def acquire(self, stop: threading.Event = None) -> bool:
+        """Block until a token is available; return False without one if stop is set first."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.updated:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return True
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.updated - now
+            if stop is None:
+                time.sleep(wait)
+            elif stop.wait(wait):
+                return False
+
+
+class ChatRateLimiter:
+    """Spaces out sends to the same chat by a minimum interval."""
+    def __init__(self, interval: float, max_entries: int = 10000) -> None:
+        self.interval = interval
+        self.max_entries = max_entries
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, chat_id) -> None:
+        with self.lock:
+            now = time.monotonic()
+            if len(self.next_slot) > self.max_entries:
+                self.next_slot = {key: slot for key, slot in self.next_slot.items() if slot > now}
+            slot = max(now, self.next_slot.get(chat_id, now))
+            self.next_slot[chat_id] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Broadcast:
+    """Progress of a single running broadcast."""
+    def __init__(self, recipients: Iterable, total: int, on_result: Callable = None) -> None:
+        self.recipients = recipients
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.cancelled = False
+        # Set by cancel() to wake workers waiting for a send slot
+        self.stopped = threading.Event()
+        # Set once there is nobody left to send to, or on cancel(), to release workers waiting for pacing
+        self.drained = threading.Event()
+        self.bucket = None
+        self.finished = threading.Event()
+        self.on_result = on_result
+        self.lock = threading.Lock()
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def record(self, chat_id, error: Optional[Exception]) -> None:
+        with self.lock:
+            if error is None:
+                self.sent += 1
+            else:
+                self.failed += 1
+        if self.on_result:
+            self.on_result(chat_id, error)
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        self.stopped.set()
+        self.drained.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Wait for in-flight sends and on_done to finish; return False on timeout."""
+        return self.finished.wait(timeout)
+
+
+class Broadcaster:
+    """Sends broadcasts concurrently from a background thread under Telegram's rate limits."""
+    def __init__(self, rate: float = GLOBAL_RATE, per_chat_interval: float = PER_CHAT_INTERVAL,
+                 workers: int = 8, max_retries: int = 3, progress_interval: float = 5.0) -> None:
+        self.bucket = TokenBucket(rate)
+        self.chat_limiter = ChatRateLimiter(per_chat_interval)
+        self.workers = workers
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+
+    def deliver(self, send: Callable, chat_id, broadcast: Broadcast = None) -> bool:
+        """Send to one chat, backing off and retrying when Telegram answers RetryAfter.
+
+        Returns False without sending if broadcast is cancelled while waiting for the rate limits.
+        """
+        stop = broadcast.stopped if broadcast else None
+        for attempt in range(self.max_retries + 1):
+            if not self.bucket.acquire(stop):
+                return False
+            self.chat_limiter.acquire(chat_id)
+            if broadcast and broadcast.cancelled:
+                return False
+            try:
+                send(chat_id)
+                return True
+            except RetryAfter as e:
+                logger.warning(f"Rate limited while sending to {chat_id}, retrying in {e.retry_after}s")
+                self.bucket.pause(e.retry_after)
+                if attempt == self.max_retries:
+                    raise
+
+    def start(self, send: Callable, recipients: Iterable, total: int, on_progress: Callable = None,
+              on_done: Callable = None, on_result: Callable = None, rate: float = None) -> Broadcast:
+        """Start a broadcast in the background and return its progress object.
+
+        With a rate, the broadcast sends at most that many messages per second, spreading it out.
+        """
+        broadcast = Broadcast(recipients, total, on_result=on_result)
+        if rate:
+            broadcast.bucket = TokenBucket(rate, capacity=1)
+        thread = threading.Thread(
+            target=self._run,
+            args=(broadcast, send, on_progress, on_done),
+            name="broadcast",
+            daemon=True,
+        )
+        thread.start()
+        return broadcast
+
+    def _run(self, broadcast: Broadcast, send: Callable, on_progress: Callable, on_done: Callable) -> None:
+        recipients = iter(broadcast.recipients)
+        # One recipient is read ahead so the last one taken releases the workers still waiting for pacing
+        upcoming = next(recipients, None)
+        if upcoming is None:
+            broadcast.drained.set()
+        lock = threading.Lock()
+
+        def worker():
+            nonlocal upcoming
+            while not broadcast.cancelled:
+                # Pace before taking a recipient, so cancelling never leaves one waiting to be sent
+                if broadcast.bucket and not broadcast.bucket.acquire(broadcast.drained):
+                    return
+                with lock:
+                    chat_id, upcoming = upcoming, next(recipients, None)
+                    if upcoming is None:
+                        broadcast.drained.set()
+                if chat_id is None:
+                    return
+                try:
+                    if not self.deliver(send, chat_id, broadcast):
+                        return  # Cancelled; the recipient stays pending for a resume
+                    error = None
+                except Exception as e:
+                    logger.error(f"Failed to send broadcast to {chat_id}: {e}")
+                    error = e
+                try:
+                    broadcast.record(chat_id, error)
+                except Exception as e:
+                    logger.error(f"Failed to record broadcast result for {chat_id}: {e}")
+
+        threads = [threading.Thread(target=worker, name=f"broadcast-{i}", daemon=True) for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(self.progress_interval)
+                if thread.is_alive() and on_progress:
+                    _safe_call(on_progress, broadcast)
+        broadcast.finished_at = time.monotonic()
+        if on_done:
+            _safe_call(on_done, broadcast)
+        broadcast.finished.set()
+
+
+def _safe_call(callback: Callable, broadcast: Broadcast) -> None:
+    try:
+        callback(broadcast)
+    except Exception as e:
+        logger.error(f"Broadcast callback failed: {e}")
+
+
+def send_payload(bot, chat_id, media_type: str, content: str) -> None:
+    """Send one broadcast payload to a chat."""
+    if media_type == 'photo':
+        bot.send_photo(chat_id=chat_id, photo=content)
+    elif media_type == 'document':
+        bot.send_document(chat_id=chat_id, document=content)
+    else:
+        bot.send_message(chat_id=chat_id, text=content)
@@ -0,0 +1,66 @@
+import os
+import threading
+import time
+from typing import Optional
+
+
+class CachedFile:
+    """A file's text together with the stat fields used to detect changes."""
+    def __init__(self, text: Optional[str], stamp: tuple, checked_at: float) -> None:
+        self.text = text
+        self.stamp = stamp
+        self.checked_at = checked_at
+
+
+class ContentCache:
+    """Keeps small text files in memory and reloads them when they change on disk."""
+    def __init__(self, check_interval: float = 1.0) -> None:
+        # Files are stat'ed at most once per check_interval seconds
+        self.check_interval = check_interval
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, path: str) -> Optional[str]:
+        """Return the file's text, or None if it does not exist."""
+        return self.get_entry(path).text
+
+    def get_entry(self, path: str) -> CachedFile:
+        """Return the cached entry; the same object is returned until the file changes."""
+        entry = self.entries.get(path)
+        now = time.monotonic()
+        if entry is not None and now - entry.checked_at < self.check_interval:
+            return entry
+        with self.lock:
+            entry = self._load(path, self.entries.get(path), now)
+            self.entries[path] = entry
+        return entry
+
+    def publish(self, path: str, text: str) -> CachedFile:
+        """Replace a file's entry with text just written to it, so readers switch to it at once."""
+        stat = os.stat(path)
+        entry = CachedFile(text, (stat.st_mtime_ns, stat.st_ino, stat.st_size), time.monotonic())
+        with self.lock:
+            self.entries[path] = entry
+        return entry
+
+    def invalidate(self, path: str) -> None:
+        """Drop a file so the next read loads it from disk."""
+        with self.lock:
+            self.entries.pop(path, None)
+
+    def _load(self, path: str, entry: Optional[CachedFile], now: float) -> CachedFile:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            if entry is not None and entry.stamp is None:
+                entry.checked_at = now
+                return entry
+            return CachedFile(None, None, now)
+        stamp = (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+        if entry is not None and entry.stamp == stamp:
+            entry.checked_at = now
+            return entry
+        with open(path, 'r') as file:
+            # Stamp the text with the file actually opened, in case it was replaced after the stat
+            stat = os.fstat(file.fileno())
+            return CachedFile(file.read(), (stat.st_mtime_ns, stat.st_ino, stat.st_size), now)
@@ -0,0 +1,129 @@
+import logging
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+from typing import List, Optional
+
+from content_cache import ContentCache
+
+logger = logging.getLogger("WarpGeneratorNG")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS content_versions (
+    path TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    author TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (path, version)
+);
+"""
+
+
+def _file_mode(path: str) -> int:
+    """Permissions of the existing file, or those a new file would get under the current umask."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def atomic_write(path: str, text: str) -> None:
+    """Write a file so that readers see either the old or the new contents, never a partial file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.")
+    try:
+        # mkstemp creates the file owner-only; keep the permissions the file had
+        os.fchmod(fd, _file_mode(path))
+        with os.fdopen(fd, 'w') as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class ContentStore:
+    """Admin-edited text files, written atomically with every version kept in SQLite.
+
+    New versions are published straight to the content cache, so readers switch
+    from one complete snapshot to the next without touching the disk.
+    """
+    def __init__(self, path: str, cache: ContentCache, max_versions: int = 50) -> None:
+        self.path = path
+        self.cache = cache
+        self.max_versions = max_versions
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def write(self, file_path: str, text: str, author=None) -> int:
+        """Atomically replace a file's contents and return the new version number."""
+        with self.lock:
+            return self._write(file_path, text, author)
+
+    def history(self, file_path: str, limit: int = 10) -> List[sqlite3.Row]:
+        """Return the most recent versions of a file, newest first."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT version, author, created_at, length(text) AS size FROM content_versions "
+                "WHERE path = ? ORDER BY version DESC LIMIT ?",
+                (file_path, limit),
+            ).fetchall()
+
+    def rollback(self, file_path: str, version: int = None) -> Optional[int]:
+        """Restore an earlier version, by default the one before the current, as a new version.
+
+        Returns the new version number, or None if there is no such version.
+        """
+        with self.lock:
+            if version is None:
+                row = self.conn.execute(
+                    "SELECT text FROM content_versions WHERE path = ? ORDER BY version DESC LIMIT 1 OFFSET 1",
+                    (file_path,),
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    "SELECT text FROM content_versions WHERE path = ? AND version = ?", (file_path, version)
+                ).fetchone()
+            if row is None:
+                return None
+            return self._write(file_path, row['text'], f"rollback to {version or 'previous'}")
+
+    def _write(self, file_path: str, text: str, author) -> int:
+        current = self.conn.execute(
+            "SELECT MAX(version) FROM content_versions WHERE path = ?", (file_path,)
+        ).fetchone()[0] or 0
+        with self.conn:
+            if current == 0 and os.path.exists(file_path):
+                # Keep the hand-edited original as version 1 so the first change can be rolled back
+                with open(file_path, 'r') as file:
+                    original = file.read()
+                current = 1
+                self.conn.execute(
+                    "INSERT INTO content_versions (path, version, text, author, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (file_path, current, original, 'original', time.time()),
+                )
+            version = current + 1
+            self.conn.execute(
+                "INSERT INTO content_versions (path, version, text, author, created_at) VALUES (?, ?, ?, ?, ?)",
+                (file_path, version, text, str(author) if author is not None else None, time.time()),
+            )
+            self.conn.execute(
+                "DELETE FROM content_versions WHERE path = ? AND version <= ?",
+                (file_path, version - self.max_versions),
+            )
+            atomic_write(file_path, text)
+        self.cache.publish(file_path, text)
+        logger.info(f"Wrote version {version} of {file_path}")
+        return version
@@ -0,0 +1,56 @@
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+logger = logging.getLogger("WarpGeneratorNG")
+
+
+class FileIdCache:
+    """Remembers the Telegram file_id of each uploaded file, tied to the file version it was uploaded from.
+
+    Entries are persisted to a small JSON file so restarts don't re-upload.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.upload_locks = {}
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as file:
+                    self.entries = json.load(file)
+            except (IOError, ValueError) as e:
+                logger.error(f"Failed to load file_id cache {path}: {e}")
+
+    def get(self, file_path: str, stamp) -> Optional[str]:
+        """Return the cached file_id if it was uploaded from this version of the file."""
+        entry = self.entries.get(file_path)
+        if entry is not None and stamp is not None and entry['stamp'] == list(stamp):
+            return entry['file_id']
+        return None
+
+    def set(self, file_path: str, stamp, file_id: str) -> None:
+        with self.lock:
+            self.entries[file_path] = {'stamp': list(stamp), 'file_id': file_id}
+            self._save()
+
+    def invalidate(self, file_path: str) -> None:
+        with self.lock:
+            if self.entries.pop(file_path, None) is not None:
+                self._save()
+
+    def upload_lock(self, file_path: str) -> threading.Lock:
+        """Lock that lets only one request upload a given file while the others wait for its file_id."""
+        with self.lock:
+            return self.upload_locks.setdefault(file_path, threading.Lock())
+
+    def _save(self) -> None:
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, 'w') as file:
+                json.dump(self.entries, file)
+            os.replace(temp_path, self.path)
+        except IOError as e:
+            logger.error(f"Failed to save file_id cache {self.path}: {e}")
@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import deque
+
+
+class SlidingWindowLimiter:
+    """Allows each key at most `limit` events in any `window` seconds."""
+    def __init__(self, limit: int, window: float, max_keys: int = 100000) -> None:
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self.events = {}
+        self.warned = {}
+        self.lock = threading.Lock()
+
+    def allow(self, key) -> bool:
+        now = time.monotonic()
+        with self.lock:
+            events = self.events.get(key)
+            if events is None:
+                if len(self.events) >= self.max_keys:
+                    self._prune(now)
+                events = self.events[key] = deque()
+            while events and now - events[0] >= self.window:
+                events.popleft()
+            if len(events) >= self.limit:
+                return False
+            events.append(now)
+            return True
+
+    def warn_due(self, key) -> bool:
+        """Return True at most once per window for a throttled key, so warnings can't be spammed either."""
+        now = time.monotonic()
+        with self.lock:
+            if now - self.warned.get(key, -self.window) < self.window:
+                return False
+            self.warned[key] = now
+            return True
+
+    def _prune(self, now: float) -> None:
+        self.events = {key: events for key, events in self.events.items() if events and now - events[-1] < self.window}
+        self.warned = {key: warned for key, warned in self.warned.items() if now - warned < self.window}
+
+
+class CallbackCoalescer:
+    """Detects repeats of the same button press by the same user within a short window."""
+    def __init__(self, window: float, max_keys: int = 100000) -> None:
+        self.window = window
+        self.max_keys = max_keys
+        self.seen = {}
+        self.lock = threading.Lock()
+
+    def is_duplicate(self, user_id, data: str) -> bool:
+        key = (user_id, data)
+        now = time.monotonic()
+        with self.lock:
+            last = self.seen.get(key)
+            if last is not None and now - last < self.window:
+                return True
+            if len(self.seen) >= self.max_keys:
+                self.seen = {key: seen for key, seen in self.seen.items() if now - seen < self.window}
+            self.seen[key] = now
+            return False
@@ -0,0 +1,192 @@
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional
+
+from telegram.error import BadRequest, Unauthorized
+
+from schema import add_missing_columns
+
+# Job statuses
+SCHEDULED = 'scheduled'
+RUNNING = 'running'
+PAUSED = 'paused'
+CANCELLED = 'cancelled'
+COMPLETED = 'completed'
+
+# Delivery states
+PENDING = 'pending'
+DELIVERED = 'delivered'
+FAILED = 'failed'
+BLOCKED = 'blocked'  # the recipient is gone for good: blocked the bot, deleted or deactivated
+
+# BadRequest descriptions that mean the chat will never accept messages again
+PERMANENT_BAD_REQUESTS = ('chat not found', 'user is deactivated', 'peer_id_invalid')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    media_type TEXT NOT NULL,
+    content TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    scheduled_at REAL,
+    rate REAL,
+    options TEXT
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    job_id INTEGER NOT NULL,
+    user_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    error TEXT,
+    updated_at REAL,
+    PRIMARY KEY (job_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS deliveries_state ON deliveries (job_id, state);
+"""
+
+# Columns added for scheduled and spread-out broadcasts
+JOB_COLUMNS = {'scheduled_at': 'REAL', 'rate': 'REAL', 'options': 'TEXT'}
+
+INDEXES = "CREATE INDEX IF NOT EXISTS jobs_schedule ON jobs (status, scheduled_at);"
+
+
+def is_permanent_failure(error: Exception) -> bool:
+    """Return True if retrying a send to this chat can never succeed."""
+    if isinstance(error, Unauthorized):
+        # 403 "Forbidden: bot was blocked by the user" and the like; a 401 is our token, not the chat
+        return error.message.startswith('Forbidden')
+    return isinstance(error, BadRequest) and any(text in error.message.lower() for text in PERMANENT_BAD_REQUESTS)
+
+
+def is_token_failure(error: Exception) -> bool:
+    """Return True if Telegram rejected the bot token itself, so no send can succeed until it is fixed."""
+    return isinstance(error, Unauthorized) and not is_permanent_failure(error)
+
+
+def delivery_state(error: Optional[Exception]) -> str:
+    """Map a send result to the delivery state stored in the ledger."""
+    if error is None:
+        return DELIVERED
+    if is_permanent_failure(error):
+        return BLOCKED
+    return FAILED
+
+
+class BroadcastJobStore:
+    """SQLite-backed broadcast jobs with a per-recipient delivery ledger."""
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        add_missing_columns(self.conn, 'jobs', JOB_COLUMNS)
+        self.conn.executescript(INDEXES)
+
+    def create_job(self, media_type: str, content: str, chat_id: int, user_ids: Iterable[str],
+                   scheduled_at: float = None, rate: float = None, options: str = None) -> int:
+        """Store a new job with every recipient pending and return its id.
+
+        Jobs with a scheduled_at start out scheduled, usually without recipients: options keeps
+        what is needed to choose them when the job starts. rate caps the job's sends per second.
+        """
+        user_ids = list(user_ids)
+        now = time.time()
+        status = SCHEDULED if scheduled_at else RUNNING
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO jobs (media_type, content, chat_id, status, total, created_at, updated_at, scheduled_at, "
+                "rate, options) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (media_type, content, chat_id, status, len(user_ids), now, now, scheduled_at, rate, options),
+            )
+            job_id = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO deliveries (job_id, user_id, state) VALUES (?, ?, ?)",
+                ((job_id, user_id, PENDING) for user_id in user_ids),
+            )
+        return job_id
+
+    def get_job(self, job_id: int) -> Optional[sqlite3.Row]:
+        with self.lock:
+            return self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def list_jobs(self, limit: int = 10) -> List[sqlite3.Row]:
+        with self.lock:
+            return self.conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+
+    def jobs_with_status(self, status: str) -> List[sqlite3.Row]:
+        with self.lock:
+            return self.conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id", (status,)).fetchall()
+
+    def due_jobs(self, now: float) -> List[sqlite3.Row]:
+        """Return scheduled jobs whose time has come."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND scheduled_at <= ? ORDER BY scheduled_at",
+                (SCHEDULED, now),
+            ).fetchall()
+
+    def set_status(self, job_id: int, status: str) -> None:
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                (status, time.time(), job_id),
+            )
+
+    def transition(self, job_id: int, from_status: str, to_status: str) -> bool:
+        """Change a job's status only if it still has from_status; return True if it did."""
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (to_status, time.time(), job_id, from_status),
+            )
+        return cursor.rowcount == 1
+
+    def start_scheduled(self, job_id: int, user_ids: Iterable[str], rate: float = None) -> bool:
+        """Move a scheduled job to running with these recipients, unless it was started or cancelled already."""
+        user_ids = list(user_ids)
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = ?, total = ?, rate = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (RUNNING, len(user_ids), rate, time.time(), job_id, SCHEDULED),
+            )
+            if cursor.rowcount != 1:
+                return False
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO deliveries (job_id, user_id, state) VALUES (?, ?, ?)",
+                ((job_id, user_id, PENDING) for user_id in user_ids),
+            )
+        return True
+
+    def pending_recipients(self, job_id: int, shard: int = 0, shards: int = 1) -> List[str]:
+        """Return the pending recipients, or only those whose ID modulo shards is shard."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT user_id FROM deliveries WHERE job_id = ? AND state = ? AND CAST(user_id AS INTEGER) % ? = ?",
+                (job_id, PENDING, shards, shard),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def record_delivery(self, job_id: int, user_id: str, state: str, error: Optional[Exception] = None) -> None:
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE deliveries SET state = ?, error = ?, updated_at = ? WHERE job_id = ? AND user_id = ?",
+                (state, str(error) if error else None, time.time(), job_id, str(user_id)),
+            )
+
+    def counts(self, job_id: int) -> dict:
+        """Return the number of recipients in each delivery state."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT state, COUNT(*) FROM deliveries WHERE job_id = ? GROUP BY state",
+                (job_id,),
+            ).fetchall()
+        counts = {PENDING: 0, DELIVERED: 0, FAILED: 0, BLOCKED: 0}
+        counts.update({row[0]: row[1] for row in rows})
+        return counts
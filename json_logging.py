@@ -0,0 +1,88 @@
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+
+# Correlation ID and sampling decision of the update the current thread is handling
+_context = threading.local()
+
+
+@contextmanager
+def correlation(correlation_id, debug_sample_rate: float = None):
+    """Tag every record logged inside the block with correlation_id.
+
+    The debug sampling decision is made once here, so an update's debug records
+    are either all kept or all dropped.
+    """
+    previous = getattr(_context, 'id', None), getattr(_context, 'sampled', None)
+    _context.id = correlation_id
+    _context.sampled = None if debug_sample_rate is None else random.random() < debug_sample_rate
+    try:
+        yield
+    finally:
+        _context.id, _context.sampled = previous
+
+
+class ContextFilter(logging.Filter):
+    """Adds the correlation ID and drops debug records that were not sampled."""
+    def __init__(self, debug_sample_rate: float = 1.0) -> None:
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = getattr(_context, 'id', None)
+        if record.levelno > logging.DEBUG or self.debug_sample_rate >= 1:
+            return True
+        sampled = getattr(_context, 'sampled', None)
+        if sampled is None:
+            sampled = random.random() < self.debug_sample_rate
+        return sampled
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queues records as they are, leaving all formatting to the listener thread."""
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        correlation_id = getattr(record, 'correlation_id', None)
+        if correlation_id is not None:
+            entry['correlation_id'] = correlation_id
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup_logging(level: str = 'INFO', debug_sample_rate: float = 1.0, stream=None) -> QueueListener:
+    """Route every log record through a queue to a background thread that writes JSON lines.
+
+    Returns the started listener; stop() it on shutdown to flush what is queued.
+    """
+    log_queue = queue.SimpleQueue()
+    handler = DeferredQueueHandler(log_queue)
+    handler.addFilter(ContextFilter(debug_sample_rate))
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter())
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    listener = QueueListener(log_queue, output)
+    listener.start()
+    return listener
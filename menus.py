@@ -0,0 +1,64 @@
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+
+class FrozenKeyboard(InlineKeyboardMarkup):
+    """Inline keyboard built once whose JSON is serialized once and reused for every send."""
+    __slots__ = ('_json',)
+
+    def __init__(self, rows: list) -> None:
+        super().__init__(tuple(tuple(row) for row in rows))
+        self._json = super().to_json()
+
+    def to_json(self) -> str:
+        return self._json
+
+
+BACK_TO_MENU_BUTTON = InlineKeyboardButton("Back to Menu", callback_data='back_to_menu')
+
+# Every keyboard the bot sends, keyed by name; filled in once by build_menus()
+MENUS = {}
+
+# Message templates
+WELCOME_TEMPLATE = "User Id: `{user_id}`\n\nHello `{first_name}`👋, Welcome to the Bot.\n-\nAuthor: @gassturn"
+MAIN_MENU_TEXT = "Welcome back to the main menu. Please choose an option:"
+CONFIG_MENU_TEXT = "Select your VPN configuration:"
+GENERATING_KEY_TEXT = "Generating WARP key, please wait..."
+KEY_GENERATED_TEMPLATE = (
+    "**🎉 Warp+ Key Generated! 🎉**\n"
+    "**Quota:** `{quota}` GiB\n"
+    "**License Key:** `{license}`"
+)
+NO_KEY_TEMPLATE = "No key available to display. Referral count: {referral_count}, Quota: {referral_count}"
+KEY_FAILED_TEMPLATE = "Failed to generate key: {error}"
+
+
+def build_menus(config_pages: list) -> None:
+    """Build every keyboard once at startup."""
+    MENUS['main'] = FrozenKeyboard([
+        [InlineKeyboardButton("Generate WARP Key", callback_data='generate_key')],
+        [InlineKeyboardButton("Config VPN", callback_data='show_config')],
+        [InlineKeyboardButton("Show Trusted Sellers", callback_data='show_trusted_sellers')],
+    ])
+    MENUS['back'] = FrozenKeyboard([[BACK_TO_MENU_BUTTON]])
+    MENUS['empty'] = FrozenKeyboard([])
+
+    config_rows = []
+    for page in config_pages:
+        while len(config_rows) <= page.row:
+            config_rows.append([])
+        config_rows[page.row].append(InlineKeyboardButton(page.label, callback_data=page.data))
+    config_rows.append([BACK_TO_MENU_BUTTON])
+    MENUS['config_providers'] = FrozenKeyboard(config_rows)
+
+    MENUS['config'] = FrozenKeyboard([
+        [InlineKeyboardButton("Generate WARP Key", callback_data='generate_key')],
+        [InlineKeyboardButton("Share Feedback", url='https://t.me/secretbipion'), InlineKeyboardButton("More Info", url='https://t.me/configpion')],
+        [InlineKeyboardButton("Delete", callback_data='delete_key')],
+    ])
+    MENUS['key_generated'] = FrozenKeyboard([[InlineKeyboardButton("Delete", callback_data='delete_key')]])
+    MENUS['generate_again'] = FrozenKeyboard([[InlineKeyboardButton("Generate Again", callback_data='generate_key')]])
+    MENUS['sellers'] = FrozenKeyboard([[InlineKeyboardButton("Delete", callback_data='delete_trusted_sellers')]])
+    MENUS['sellers_with_back'] = FrozenKeyboard([
+        [InlineKeyboardButton("Delete", callback_data='delete_trusted_sellers')],
+        [BACK_TO_MENU_BUTTON],
+    ])
@@ -0,0 +1,251 @@
+import bisect
+import logging
+import threading
+import time
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import ExtBot
+
+logger = logging.getLogger("WarpGeneratorNG")
+
+# Upper bounds in seconds for latency histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+    def __init__(self, name: str, help: str, labels: tuple = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from a callback when rendered."""
+    def __init__(self, name: str, help: str, read: Callable = None) -> None:
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def value(self) -> float:
+        return self.read() if self.read else 0
+
+    def render(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.value()}"]
+
+
+class Histogram:
+    """Fixed-bucket histogram with optional labels."""
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *label_values) -> Callable:
+        """Decorator that observes how long each call takes."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, *label_values)
+            return wrapper
+        return decorator
+
+    def count(self, *label_values) -> int:
+        series = self.series.get(label_values)
+        return series[2] if series else 0
+
+    def quantile(self, q: float, *label_values) -> float:
+        """Estimate a quantile by interpolating within its bucket."""
+        series = self.series.get(label_values)
+        if not series or not series[2]:
+            return 0.0
+        rank = q * series[2]
+        seen = 0
+        for index, count in enumerate(series[0]):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self.series.items())
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, label_values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics = []
+        self.started_at = time.time()
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+UPDATES = REGISTRY.register(Counter("bot_updates_total", "Updates received from Telegram."))
+HANDLER_SECONDS = REGISTRY.register(Histogram(
+    "bot_handler_seconds", "Time spent running each handler.", labels=('handler',)))
+CALLBACK_SECONDS = REGISTRY.register(Histogram(
+    "bot_callback_seconds", "Time spent running each callback query route.", labels=('route',)))
+THROTTLED = REGISTRY.register(Counter(
+    "bot_throttled_updates_total", "Updates answered cheaply by flood control.", labels=('reason',)))
+QUEUE_DEPTH = REGISTRY.register(Gauge("bot_handler_queue_depth", "Updates waiting for or running on the handler pool."))
+API_SECONDS = REGISTRY.register(Histogram(
+    "bot_api_seconds", "Latency of Telegram Bot API requests.", labels=('method',)))
+API_ERRORS = REGISTRY.register(Counter(
+    "bot_api_errors_total", "Telegram Bot API errors.", labels=('method', 'error')))
+RETRY_AFTER = REGISTRY.register(Counter(
+    "bot_api_retry_after_total", "RetryAfter (flood control) answers from Telegram.", labels=('method',)))
+BROADCAST_DELIVERIES = REGISTRY.register(Counter(
+    "bot_broadcast_deliveries_total", "Broadcast sends by delivery state.", labels=('state',)))
+
+
+def _latency_lines(histogram: Histogram) -> list:
+    lines = []
+    with histogram.lock:
+        series = sorted(histogram.series)
+    for label_values in series:
+        lines.append(
+            f"  {', '.join(label_values)}: {histogram.count(*label_values)} calls, "
+            f"p50 {histogram.quantile(0.5, *label_values) * 1000:.0f}ms, "
+            f"p99 {histogram.quantile(0.99, *label_values) * 1000:.0f}ms"
+        )
+    return lines or ["  none yet"]
+
+
+def stats_text() -> str:
+    """Human-readable summary of the registry for the /stats command."""
+    uptime = time.time() - REGISTRY.started_at
+    updates = UPDATES.total()
+    with BROADCAST_DELIVERIES.lock:
+        deliveries = dict(BROADCAST_DELIVERIES.values)
+    delivered = deliveries.get(('delivered',), 0)
+    lines = [
+        f"Uptime: {uptime / 3600:.1f}h",
+        f"Updates: {updates:.0f} ({updates / uptime:.2f}/s)",
+        f"Handler queue depth: {QUEUE_DEPTH.value()}",
+        "Handlers:",
+        *_latency_lines(HANDLER_SECONDS),
+        "Callback routes:",
+        *_latency_lines(CALLBACK_SECONDS),
+        f"Throttled updates: {THROTTLED.total():.0f}",
+        f"Telegram API errors: {API_ERRORS.total():.0f}, RetryAfter: {RETRY_AFTER.total():.0f}",
+        f"Broadcast deliveries: {delivered:.0f} delivered, {deliveries.get(('failed',), 0):.0f} failed, "
+        f"{deliveries.get(('blocked',), 0):.0f} blocked",
+    ]
+    return "\n".join(lines)
+
+
+class MeteredBot(ExtBot):
+    """Bot that records latency and errors of every Bot API call."""
+    __slots__ = ()
+
+    def _post(self, endpoint: str, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super()._post(endpoint, *args, **kwargs)
+        except RetryAfter:
+            RETRY_AFTER.inc(endpoint)
+            raise
+        except TelegramError as e:
+            API_ERRORS.inc(endpoint, type(e).__name__)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - start, endpoint)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """Serves the registry in Prometheus text format on /metrics."""
+    daemon_threads = True
+
+    def __init__(self, listen: str, port: int) -> None:
+        super().__init__((listen, port), MetricsHandler)
+
+    def start(self) -> None:
+        threading.Thread(target=self.serve_forever, name="metrics", daemon=True).start()
+        logger.info(f"Metrics available on http://{self.server_address[0]}:{self.server_address[1]}/metrics")
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
@@ -1,42 +1,103 @@
-import httpx
+import time
+
+# Startup is timed from here, so the reported figure includes loading the modules below
+STARTUP_STARTED = time.perf_counter()
+
+import json
 import logging
 import random
-import json
+import signal
 import os
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
-from telegram.ext import Updater, CommandHandler, CallbackContext, CallbackQueryHandler
+import re
+import threading
+from telegram import Update
+from telegram.error import BadRequest
+from telegram.ext import Updater, CommandHandler, CallbackContext, CallbackQueryHandler, TypeHandler, DispatcherHandlerStop
+from telegram.utils.request import Request
 from functools import wraps
 from dotenv import load_dotenv
+from broadcaster import Broadcaster, send_payload, GLOBAL_RATE
+from job_store import BroadcastJobStore, delivery_state, is_token_failure, SCHEDULED, RUNNING, PAUSED, CANCELLED, COMPLETED, BLOCKED
+from user_store import UserStore
+from content_cache import ContentCache
+from content_store import ContentStore
+from file_id_cache import FileIdCache
+from roles import RoleStore, ADMIN
+from router import CallbackRouter
+from webhook import WebhookServer
+from worker_pool import ChatOrderedPool, chat_key
+from notifier import NewUserDigest
+from menus import (
+    MENUS, build_menus, WELCOME_TEMPLATE, MAIN_MENU_TEXT, CONFIG_MENU_TEXT, GENERATING_KEY_TEXT,
+    KEY_GENERATED_TEMPLATE, NO_KEY_TEMPLATE, KEY_FAILED_TEMPLATE, BACK_TO_MENU_BUTTON,
+)
+from paging import PagedContent
+from metrics import (
+    MeteredBot, MetricsServer, stats_text, UPDATES, HANDLER_SECONDS, CALLBACK_SECONDS, QUEUE_DEPTH,
+    BROADCAST_DELIVERIES, THROTTLED,
+)
+from flood_control import SlidingWindowLimiter, CallbackCoalescer
+from json_logging import setup_logging, correlation
+from sharding import ShardQueue, ShardConsumer, SharedTokenBucket, shard_of
 
 # Load environment variables
 load_dotenv()
 
-# Define your admin user IDs
+# Sharding: with SHARD_COUNT > 1 one process runs with SHARD_ROLE=ingress and receives
+# updates, and SHARD_COUNT processes run with SHARD_ROLE=worker and SHARD_INDEX=0..N-1.
+# Each worker handles the chats whose ID modulo SHARD_COUNT is its index, in order,
+# and sends that slice of every broadcast
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '1'))
+SHARD_ROLE = os.getenv('SHARD_ROLE', 'worker')
+SHARD_INDEX = int(os.getenv('SHARD_INDEX', '0'))
+
+
+def process_path(path: str) -> str:
+    """Give each sharded process its own copy of a state file, e.g. pending_alerts.shard1.json."""
+    if SHARD_COUNT <= 1:
+        return path
+    root, ext = os.path.splitext(path)
+    name = 'ingress' if SHARD_ROLE == 'ingress' else f'shard{SHARD_INDEX}'
+    return f"{root}.{name}{ext}"
+
+
+# Define your admin user IDs; they stay admins whatever authorized_users.txt says
 ADMINS = [2129865779]  # Replace with your real admin user IDs
 
 # Path to the configuration file
 CONFIG_FILE_PATH = 'file.txt'
+SELLERS_FILE_PATH = 'seller.txt'
 
-def read_config() -> str:
-    """Read configuration from file with proper formatting."""
-    if not os.path.exists(CONFIG_FILE_PATH):
-        return "Configuration file not found."
-    
-    try:
-        with open(CONFIG_FILE_PATH, 'r') as file:
-            return file.read()
-    except IOError as e:
-        logger.error(f"Failed to read config file: {e}")
-        return "Error reading configuration file."
+# Config and seller texts are served from memory and reloaded when the files change
+CONTENT_CACHE = ContentCache()
+
+# Admin edits replace the files atomically and every version is kept for /rollback
+CONTENT_DB_PATH = 'content.db'
+CONTENT_STORE = ContentStore(CONTENT_DB_PATH, CONTENT_CACHE)
+
+# Roles granted with /grant live in this file and are reloaded when it changes
+AUTHORIZED_USERS_FILE = 'authorized_users.txt'
+ROLES = RoleStore(AUTHORIZED_USERS_FILE, CONTENT_STORE, owners=ADMINS)
 
+# Admin-editable files by the name used in /history and /rollback
+EDITABLE_FILES = {'config': CONFIG_FILE_PATH, 'sellers': SELLERS_FILE_PATH, 'roles': AUTHORIZED_USERS_FILE}
 
-def write_config(content: str) -> None:
-    """Write new configuration to file with proper formatting."""
-    with open(CONFIG_FILE_PATH, 'w') as file:
-        file.write(content.strip())  # Strip leading/trailing whitespace
+# Set CONFIG_DELIVERY=document to send config files as documents; each version is uploaded
+# once and later sends reuse the file_id Telegram returned for it
+CONFIG_DELIVERY = os.getenv('CONFIG_DELIVERY', 'text')
+FILE_ID_CACHE = FileIdCache(process_path('file_ids.json'))
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+def write_config(content: str, author=None) -> int:
+    """Write new configuration to file with proper formatting and return its version."""
+    version = CONTENT_STORE.write(CONFIG_FILE_PATH, content.strip(), author)  # Strip leading/trailing whitespace
+    FILE_ID_CACHE.invalidate(CONFIG_FILE_PATH)
+    return version
+
+# Set up logging: JSON lines written by a background thread; only a sample of
+# updates (LOG_DEBUG_SAMPLE_RATE) keep their debug records
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG')
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '0.05'))
+LOG_LISTENER = setup_logging(LOG_LEVEL, LOG_DEBUG_SAMPLE_RATE)
 logger = logging.getLogger("WarpGeneratorNG")
 
 FALLBACK_BASE_KEYS = [
@@ -85,6 +146,7 @@ class GenerateResults:
         return f"WarpGenerateResults(account_type={self.account_type}, referral_count={self.referral_count}, license_code={self.license_code})"
 
 def register_single() -> User:
+    import httpx  # Only key generation needs httpx, so it is loaded on first use rather than at startup
     logger.debug("Start registering new account")
     client = httpx.Client(
         base_url="https://api.cloudflareclient.com/v0a2223",
@@ -99,6 +161,7 @@ def register_single() -> User:
     return User(user_id=user_id, license_code=license_code, token=token)
 
 def generate_key(base_key: str) -> GenerateResults:
+    import httpx
     logger.debug("Start generating new key")
     client = httpx.Client(
         base_url="https://api.cloudflareclient.com/v0a2223",
@@ -157,10 +220,10 @@ def validate_base_key(key: str) -> bool:
 def generate_warp_key(update: Update, context: CallbackContext) -> None:
     """Generate WARP key and send it as a message with delete button."""
     if update.message:
-        initial_message = update.message.reply_text("Generating WARP key, please wait...", parse_mode='Markdown')
+        initial_message = update.message.reply_text(GENERATING_KEY_TEXT, parse_mode='Markdown')
     elif update.callback_query:
         update.callback_query.answer("Generating WARP key...")
-        initial_message = update.callback_query.message.reply_text("Generating WARP key, please wait...", parse_mode='Markdown')
+        initial_message = update.callback_query.message.reply_text(GENERATING_KEY_TEXT, parse_mode='Markdown')
     else:
         logger.error("update is not a message or callback query")
         return
@@ -171,48 +234,40 @@ def generate_warp_key(update: Update, context: CallbackContext) -> None:
 
         # Check if the key generation was successful
         if result.referral_count > 0 and result.license_code:
-            key_info = {'Quota': result.referral_count, 'license': result.license_code}
-            message = (
-                "**🎉 Warp+ Key Generated! 🎉**\n"
-                f"**Quota:** `{key_info['Quota']}` GiB\n"
-                f"**License Key:** `{key_info['license']}`"
-            )
-            keyboard = [
-                [InlineKeyboardButton("Delete", callback_data='delete_key')]
-            ]
+            message = KEY_GENERATED_TEMPLATE.format(quota=result.referral_count, license=result.license_code)
+            reply_markup = MENUS['key_generated']
         else:
-            message = f"No key available to display. Referral count: {result.referral_count}, Quota: {result.referral_count}"
-            keyboard = [
-                [InlineKeyboardButton("Generate Again", callback_data='generate_key')]
-            ]
+            message = NO_KEY_TEMPLATE.format(referral_count=result.referral_count)
+            reply_markup = MENUS['generate_again']
 
     except Exception as e:
-        message = f"Failed to generate key: {str(e)}"
-        keyboard = []
+        message = KEY_FAILED_TEMPLATE.format(error=e)
+        reply_markup = MENUS['empty']
 
-    if update.message:
-        initial_message.edit_text(message, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
-    elif update.callback_query:
-        initial_message.edit_text(message, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
+    initial_message.edit_text(message, parse_mode='Markdown', reply_markup=reply_markup)
 
 
-def notify_admin_new_user(user_id: str, user_name: str, context: CallbackContext) -> None:
-    """Notify admin about a new user."""
-    admin_chat_id = ADMINS[0]  # Replace with the appropriate admin chat ID
-    message = (f"**New User Alert!**\n"
-               f"**User ID:** `{user_id}`\n"
-               f"**User Name:** `{user_name}`")
-    try:
-        context.bot.send_message(chat_id=admin_chat_id, text=message, parse_mode='Markdown')
-    except Exception as e:
-        logger.error(f"Failed to notify admin about new user {user_id}: {e}")
+# New-user alerts are batched into a digest for all admins instead of one message per /start
+NEW_USER_DIGEST_INTERVAL = 60
+NEW_USER_DIGEST_BATCH = 25
+# Alerts not yet sent when the bot stops are kept here and sent after the next start
+NEW_USER_DIGEST_STATE = process_path('pending_alerts.json')
+NEW_USER_DIGEST = NewUserDigest(
+    interval=NEW_USER_DIGEST_INTERVAL, max_batch=NEW_USER_DIGEST_BATCH, state_path=NEW_USER_DIGEST_STATE
+)
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+def notify_admin_new_user(user_id: str, user_name: str) -> None:
+    """Queue a new user for the next admin digest."""
+    NEW_USER_DIGEST.add(user_id, user_name)
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+def notify_admins(bot, message: str) -> None:
+    """Send a message to every admin."""
+    for admin_chat_id in ROLES.members(ADMIN):
+        try:
+            bot.send_message(chat_id=admin_chat_id, text=message, parse_mode='Markdown')
+        except Exception as e:
+            logger.error(f"Failed to notify admin {admin_chat_id}: {e}")
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import CallbackContext
 
 def start(update: Update, context: CallbackContext) -> None:
     """Handle /start command."""
@@ -221,24 +276,14 @@ def start(update: Update, context: CallbackContext) -> None:
         user_id = str(user.id)
         user_name = user.first_name
         
-        # Save the user ID for future broadcasts
-        save_user_id(user_id)
-        
-        # Notify admin about the new user
-        notify_admin_new_user(user_id, user_name, context)
-        
-        # Create an inline keyboard with "Generate WARP Key", "Config VPN", and "Show Trusted Sellers" buttons
-        keyboard = [
-            [InlineKeyboardButton("Generate WARP Key", callback_data='generate_key')],
-            [InlineKeyboardButton("Config VPN", callback_data='show_config')],
-            [InlineKeyboardButton("Show Trusted Sellers", callback_data='show_trusted_sellers')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        # Save the user ID for future broadcasts and tell the admins about first-time users
+        if save_user_id(user_id):
+            notify_admin_new_user(user_id, user_name)
         
         update.message.reply_text(
-            f"User Id: `{user_id}`\n\nHello `{user.first_name}`👋, Welcome to the Bot.\n-\nAuthor: @gassturn",
+            WELCOME_TEMPLATE.format(user_id=user_id, first_name=user.first_name),
             parse_mode='Markdown',
-            reply_markup=reply_markup
+            reply_markup=MENUS['main']
         )
     else:
         logger.error("update.message is None in /start handler")
@@ -247,31 +292,31 @@ def start(update: Update, context: CallbackContext) -> None:
 def config(update: Update, context: CallbackContext) -> None:
     """Handle /config command."""
     if update.message:
-        config_message = read_config()
-        keyboard = [
-            [InlineKeyboardButton("Generate WARP Key", callback_data='generate_key')],
-            [InlineKeyboardButton("Share Feedback", url='https://t.me/secretbipion'), InlineKeyboardButton("More Info", url='https://t.me/configpion')],
-            [InlineKeyboardButton("Delete", callback_data='delete_key')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        update.message.reply_text(config_message, reply_markup=reply_markup, parse_mode='Markdown')
+        if CONFIG_DELIVERY == 'document':
+            send_config_document(context.bot, update.message.chat_id, CONFIG_FILE_PATH, reply_markup=MENUS['config'])
+        else:
+            send_page(update.message, CONFIG_CONTENT)
     else:
         logger.error("update.message is None in /config handler")
 
 
-def admin_only(func):
-    """Decorator to ensure only admins can use certain commands."""
-    @wraps(func)
-    def wrapper(update: Update, context: CallbackContext, *args, **kwargs):
-        if update.message:
-            user_id = update.message.from_user.id
-            if user_id in ADMINS:
-                return func(update, context, *args, **kwargs)
+def require_role(role: str):
+    """Decorator to ensure only users with a role (or admins) can use certain commands."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(update: Update, context: CallbackContext, *args, **kwargs):
+            if update.message:
+                user_id = update.message.from_user.id
+                if ROLES.has(user_id, role):
+                    return func(update, context, *args, **kwargs)
+                else:
+                    update.message.reply_text("Sorry, you don't have permission to use this command.")
             else:
-                update.message.reply_text("Sorry, you don't have permission to use this command.")
-        else:
-            logger.error("update.message is None in admin_only decorator")
-    return wrapper
+                logger.error(f"update.message is None in {role} role check")
+        return wrapper
+    return decorator
+
+admin_only = require_role(ADMIN)
 
 @admin_only
 def update_config(update: Update, context: CallbackContext) -> None:
@@ -283,7 +328,7 @@ def update_config(update: Update, context: CallbackContext) -> None:
             update.message.reply_text("Please provide the new configuration text.")
             return
         
-        write_config(new_config)
+        write_config(new_config, update.message.from_user.id)
         
         sent_message = update.message.reply_text("Configuration updated successfully. Here is the updated config: /config", parse_mode='Markdown')
         
@@ -304,31 +349,379 @@ def update_trusted_sellers(update: Update, context: CallbackContext) -> None:
             return
         
         # Write to seller.txt, preserving new lines
-        with open('seller.txt', 'w') as file:
-            file.write(new_sellers_list)
+        CONTENT_STORE.write(SELLERS_FILE_PATH, new_sellers_list, update.message.from_user.id)
         
         update.message.reply_text("Trusted sellers list updated successfully.")
     else:
         logger.error("update.message is None in /update_trusted_sellers handler")
 
+def parse_editable_file(update: Update, context: CallbackContext):
+    """Return the file path named by the first command argument, replying if it is unknown."""
+    name = context.args[0] if context.args else None
+    file_path = EDITABLE_FILES.get(name)
+    if file_path is None:
+        update.message.reply_text(f"Please name the file: {', '.join(EDITABLE_FILES)}")
+    return file_path
+
+@admin_only
+def content_history(update: Update, context: CallbackContext) -> None:
+    """List the stored versions of an admin-edited file."""
+    file_path = parse_editable_file(update, context)
+    if file_path is None:
+        return
+    versions = CONTENT_STORE.history(file_path)
+    if not versions:
+        update.message.reply_text(f"{file_path} has not been edited yet.")
+        return
+    lines = [
+        f"v{row['version']} {time.strftime('%Y-%m-%d %H:%M', time.localtime(row['created_at']))} "
+        f"by {row['author'] or 'unknown'} ({row['size']} chars)"
+        for row in versions
+    ]
+    update.message.reply_text("\n".join(lines))
+
+@admin_only
+def rollback_content(update: Update, context: CallbackContext) -> None:
+    """Restore an earlier version of an admin-edited file, by default the previous one."""
+    file_path = parse_editable_file(update, context)
+    if file_path is None:
+        return
+    version = context.args[1] if len(context.args) > 1 else None
+    if version is not None and not version.isdigit():
+        update.message.reply_text("The version must be a number, see /history.")
+        return
+    new_version = CONTENT_STORE.rollback(file_path, int(version) if version else None)
+    if new_version is None:
+        update.message.reply_text(f"No such version of {file_path}, see /history.")
+        return
+    FILE_ID_CACHE.invalidate(file_path)
+    update.message.reply_text(f"Rolled {file_path} back; it is now version {new_version}.")
+
+
+def parse_role_args(update: Update, context: CallbackContext):
+    """Return the (user ID, role) named by the command arguments, replying if they are missing."""
+    if not context.args or not context.args[0].isdigit():
+        update.message.reply_text("Please provide a user ID and optionally a role (default: admin).")
+        return None
+    return int(context.args[0]), context.args[1] if len(context.args) > 1 else ADMIN
+
+@admin_only
+def grant_role(update: Update, context: CallbackContext) -> None:
+    """Give a user a role."""
+    args = parse_role_args(update, context)
+    if args is None:
+        return
+    user_id, role = args
+    if ROLES.grant(user_id, role, update.message.from_user.id):
+        update.message.reply_text(f"Granted {role} to {user_id}.")
+    else:
+        update.message.reply_text(f"{user_id} already has {role}.")
+
+@admin_only
+def revoke_role(update: Update, context: CallbackContext) -> None:
+    """Take a role away from a user."""
+    args = parse_role_args(update, context)
+    if args is None:
+        return
+    user_id, role = args
+    if role == ADMIN and user_id in ROLES.owners:
+        update.message.reply_text(f"{user_id} is listed in ADMINS and always stays an admin.")
+    elif ROLES.revoke(user_id, role, update.message.from_user.id):
+        update.message.reply_text(f"Revoked {role} from {user_id}.")
+    else:
+        update.message.reply_text(f"{user_id} doesn't have {role}.")
+
+@admin_only
+def list_roles(update: Update, context: CallbackContext) -> None:
+    """List every role and its members."""
+    lines = [
+        f"{role}: {', '.join(str(user_id) for user_id in sorted(user_ids)) or 'nobody'}"
+        for role, user_ids in sorted(ROLES.all_roles().items())
+    ]
+    update.message.reply_text("\n".join(lines))
+
 
 USER_IDS_FILE = 'user_ids.txt'
 
-def load_user_ids() -> set:
-    """Load user IDs from file."""
-    if os.path.exists(USER_IDS_FILE):
-        with open(USER_IDS_FILE, 'r') as file:
-            return set(line.strip() for line in file)
-    return set()
+# Users live in SQLite next to the old user_ids.txt, which is imported on first run
+USERS_DB_PATH = os.path.join(os.path.dirname(USER_IDS_FILE), 'users.db')
+USER_STORE = UserStore(USERS_DB_PATH, legacy_ids_path=USER_IDS_FILE)
+
+def load_user_ids() -> list:
+    """Return the IDs of every user that broadcasts can still reach."""
+    if SHARD_COUNT > 1:
+        # Other worker processes add users too
+        USER_STORE.reload()
+    return USER_STORE.user_ids(include_blocked=False)
+
+def save_user_id(user_id: str) -> bool:
+    """Record a user visit and return True if the user is new."""
+    return USER_STORE.add(user_id)
+
+# Sharded processes share the update queue and broadcast rate budget through this database
+SHARD_DB_PATH = os.path.join(os.path.dirname(USER_IDS_FILE), 'shards.db')
+SHARD_QUEUE = ShardQueue(SHARD_DB_PATH) if SHARD_COUNT > 1 else None
+BROADCAST_POLL_INTERVAL = 5  # seconds between checks for broadcasts started by other workers
+
+# Sends broadcasts in the background so the dispatcher stays responsive
+BROADCAST_WORKERS = 8
+BROADCASTER = Broadcaster(workers=BROADCAST_WORKERS)
+if SHARD_COUNT > 1:
+    # Every worker draws from one send budget so together they stay under Telegram's limit
+    BROADCASTER.bucket = SharedTokenBucket(SHARD_DB_PATH, 'broadcast', GLOBAL_RATE)
+
+# Broadcast jobs and their delivery ledger live next to the user IDs file
+BROADCAST_DB_PATH = os.path.join(os.path.dirname(USER_IDS_FILE), 'broadcasts.db')
+JOB_STORE = BroadcastJobStore(BROADCAST_DB_PATH)
+RUNNING_JOBS = {}
+# Held while a job is created and started so the broadcast poller can't start it twice
+BROADCAST_LOCK = threading.RLock()
+
+def run_broadcast_job(bot, job_id: int, status_message=None, quiet: bool = False, from_status: str = RUNNING) -> bool:
+    """Send a stored broadcast job to this shard's pending recipients in the background.
+
+    The job must be in from_status, which is moved to running; returns False if it isn't, e.g.
+    because it was paused or cancelled meanwhile. Quiet runs (another worker's share of a job)
+    only message the admin if they finish the job.
+    """
+    with BROADCAST_LOCK:
+        if job_id in RUNNING_JOBS:
+            return False
+        job = JOB_STORE.get_job(job_id)
+        if job is None or job['status'] != from_status:
+            return False
+        recipients = JOB_STORE.pending_recipients(job_id, SHARD_INDEX, SHARD_COUNT)
+        if quiet and not recipients:
+            return False
+        if from_status != RUNNING and not JOB_STORE.transition(job_id, from_status, RUNNING):
+            return False
+        if status_message is None and not quiet:
+            status_message = bot.send_message(
+                chat_id=job['chat_id'],
+                text=f"Broadcast #{job_id}: resuming for {len(recipients)} remaining users...",
+            )
+        _start_broadcast_run(bot, job, recipients, status_message)
+        return True
+
+
+def _start_broadcast_run(bot, job, recipients: list, status_message) -> None:
+    job_id = job['id']
+
+    def send(user_id):
+        send_payload(bot, user_id, job['media_type'], job['content'])
+
+    def on_result(user_id, error):
+        if is_token_failure(error):
+            # Nothing can be sent until the token is fixed; leave the recipient pending and pause the job
+            if JOB_STORE.transition(job_id, RUNNING, PAUSED):
+                logger.error(f"Bot token rejected, pausing broadcast #{job_id}: {error}")
+            run = RUNNING_JOBS.get(job_id)
+            if run:
+                run.cancel()
+            return
+        state = delivery_state(error)
+        JOB_STORE.record_delivery(job_id, user_id, state, error)
+        BROADCAST_DELIVERIES.inc(state)
+        if state == BLOCKED and USER_STORE.set_blocked(user_id, reason=str(error)):
+            logger.info(f"Pruned unreachable user {user_id}: {error}")
+
+    progress_text = None
+
+    def on_progress(run):
+        nonlocal progress_text
+        if JOB_STORE.get_job(job_id)['status'] != RUNNING:
+            # Paused or cancelled through another worker, or after the token was rejected
+            run.cancel()
+        text = f"Broadcast #{job_id}: {run.done}/{run.total} done, {run.failed} failed."
+        # Telegram rejects edits that don't change the text, which happens while sends are throttled or spread out
+        if status_message and text != progress_text:
+            status_message.edit_text(text)
+            progress_text = text
+
+    def on_done(run):
+        RUNNING_JOBS.pop(job_id, None)
+        status = JOB_STORE.get_job(job_id)['status']
+        if status == RUNNING and run.cancelled:
+            # Stopped by a shutdown; the job stays running so the next start resumes it
+            if status_message:
+                status_message.edit_text(
+                    f"Broadcast #{job_id} interrupted by a restart after {run.done}/{run.total}; it will resume."
+                )
+            return
+        counts = JOB_STORE.counts(job_id)
+        if status == RUNNING:
+            if counts['pending'] and SHARD_COUNT > 1:
+                # Other workers are still sending their share; the last one to finish reports
+                if status_message:
+                    status_message.edit_text(
+                        f"Broadcast #{job_id}: this worker's share is done, {counts['pending']} users left on others."
+                    )
+                return
+            if not JOB_STORE.transition(job_id, RUNNING, COMPLETED):
+                return
+            status = COMPLETED
+        elif status_message is None:
+            return
+        summary = (
+            f"Broadcast #{job_id} {status}: {job['media_type']} delivered to {counts['delivered']} of {job['total']} users "
+            f"({counts['failed']} failed, {counts['blocked']} blocked, {counts['pending']} pending) in {run.elapsed:.1f}s."
+        )
+        if status_message:
+            status_message.edit_text(summary)
+        else:
+            bot.send_message(chat_id=job['chat_id'], text=summary)
+
+    # A spread-out job's rate is shared between the workers sending it
+    rate = job['rate'] / SHARD_COUNT if job['rate'] else None
+    RUNNING_JOBS[job_id] = BROADCASTER.start(
+        send, recipients, len(recipients), on_progress=on_progress, on_done=on_done, on_result=on_result, rate=rate
+    )
+
+
+def resume_interrupted_jobs(bot) -> None:
+    """Resume broadcasts that were still running when the bot last stopped."""
+    for job in JOB_STORE.jobs_with_status(RUNNING):
+        if job['id'] in RUNNING_JOBS:
+            continue
+        logger.info(f"Resuming interrupted broadcast #{job['id']}")
+        try:
+            run_broadcast_job(bot, job['id'], quiet=SHARD_COUNT > 1)
+        except Exception as e:
+            logger.error(f"Failed to resume broadcast #{job['id']}: {e}")
+
+
+def start_due_jobs(bot) -> None:
+    """Start scheduled broadcasts whose time has come."""
+    for job in JOB_STORE.due_jobs(time.time()):
+        # The audience is chosen now, so users who joined, left or changed since scheduling are accounted for
+        user_ids, rate = resolve_audience(json.loads(job['options'] or '{}'))
+        # Only one worker wins the start; the others pick up their share as a running job
+        if not JOB_STORE.start_scheduled(job['id'], user_ids, rate):
+            continue
+        logger.info(f"Starting scheduled broadcast #{job['id']}")
+        job = JOB_STORE.get_job(job['id'])
+        try:
+            status_message = bot.send_message(
+                chat_id=job['chat_id'], text=f"Broadcast #{job['id']}: scheduled send to {job['total']} users starting..."
+            )
+            run_broadcast_job(bot, job['id'], status_message)
+        except Exception as e:
+            logger.error(f"Failed to start scheduled broadcast #{job['id']}: {e}")
+
+
+def poll_broadcasts(bot, stopped: threading.Event) -> None:
+    """Start scheduled broadcasts when due and, when sharded, pick up other workers' broadcasts."""
+    while not stopped.wait(BROADCAST_POLL_INTERVAL):
+        try:
+            start_due_jobs(bot)
+            if SHARD_COUNT > 1:
+                resume_interrupted_jobs(bot)
+        except Exception as e:
+            logger.error(f"Failed to check for new broadcasts: {e}")
+
+
+# Options that may precede the text of /broadcast, e.g. "/broadcast active=7d over=2h Hello":
+#   at=YYYY-MM-DDTHH:MM or at=HH:MM  send at that local time     in=2h    send after a delay
+#   over=3h     spread the sends over this long                 active=7d  users seen in the last 7 days
+#   new=3d      users who joined in the last 3 days             never=<menu>  users who never opened a menu
+BROADCAST_OPTIONS = ('at', 'in', 'over', 'active', 'new', 'never')
+BROADCAST_OPTION_PATTERN = re.compile(rf"({'|'.join(BROADCAST_OPTIONS)})=(\S+)")
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)([smhd])")
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_duration(text: str) -> float:
+    """Parse durations like 90s, 30m, 2h or 7d into seconds."""
+    match = DURATION_PATTERN.fullmatch(text)
+    if not match or float(match.group(1)) <= 0:
+        raise ValueError(f"Invalid duration '{text}', use a positive number followed by s, m, h or d.")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+def parse_time(text: str) -> float:
+    """Parse a local time, YYYY-MM-DDTHH:MM or HH:MM (the next time that clock time comes round)."""
+    try:
+        if 'T' in text:
+            return time.mktime(time.strptime(text, '%Y-%m-%dT%H:%M'))
+        clock = time.strptime(text, '%H:%M')
+    except ValueError:
+        raise ValueError(f"Invalid time '{text}', use YYYY-MM-DDTHH:MM or HH:MM.")
+    now = time.localtime()
+    at = time.mktime((now.tm_year, now.tm_mon, now.tm_mday, clock.tm_hour, clock.tm_min, 0, 0, 0, -1))
+    return at if at > time.time() else at + DURATION_UNITS['d']
+
+
+def parse_broadcast_options(args: list):
+    """Split broadcast options from the text.
+
+    Returns (options, scheduled_at, remaining args), where options holds the audience filters
+    and spread as seconds or a menu name; raises ValueError for bad options.
+    """
+    given = {}
+    while args and BROADCAST_OPTION_PATTERN.fullmatch(args[0]):
+        name, value = BROADCAST_OPTION_PATTERN.fullmatch(args[0]).groups()
+        given[name] = value
+        args = args[1:]
+    options = {name: parse_duration(given[name]) for name in ('active', 'new', 'over') if name in given}
+    if 'never' in given:
+        if given['never'] not in TRACKED_MENUS:
+            raise ValueError(f"Unknown menu '{given['never']}'. Choose one of: {', '.join(sorted(TRACKED_MENUS))}")
+        options['never'] = given['never']
+    scheduled_at = None
+    if 'at' in given:
+        scheduled_at = parse_time(given['at'])
+    elif 'in' in given:
+        scheduled_at = time.time() + parse_duration(given['in'])
+    return options, scheduled_at, args
+
+
+def resolve_audience(options: dict):
+    """Return (user_ids, rate): the users matching the options right now and the send rate that spreads them."""
+    now = time.time()
+    if {'active', 'new', 'never'} & options.keys():
+        user_ids = USER_STORE.segment(
+            active_since=now - options['active'] if 'active' in options else None,
+            joined_since=now - options['new'] if 'new' in options else None,
+            never_opened=options.get('never'),
+        )
+    else:
+        user_ids = load_user_ids()
+    rate = None
+    if 'over' in options and user_ids:
+        rate = len(user_ids) / options['over']
+        if rate >= GLOBAL_RATE:
+            rate = None  # Can't go any faster than the global limit anyway
+    return user_ids, rate
+
+
+def start_broadcast_job(bot, message, media_type: str, content: str, label: str,
+                        options: dict = None, scheduled_at: float = None) -> None:
+    """Create a broadcast job for the users matching options (everyone reachable by default) and start or schedule it.
+
+    A scheduled job chooses its recipients when it starts.
+    """
+    options = options or {}
+    with BROADCAST_LOCK:
+        user_ids, rate = resolve_audience(options)
+        if scheduled_at:
+            job_id = JOB_STORE.create_job(
+                media_type, content, message.chat_id, [], scheduled_at, options=json.dumps(options)
+            )
+            when = time.strftime('%Y-%m-%d %H:%M', time.localtime(scheduled_at))
+            message.reply_text(
+                f"Broadcast #{job_id}: {label} scheduled for {when}; its recipients are chosen then "
+                f"({len(user_ids)} users match now)."
+            )
+            return
+        job_id = JOB_STORE.create_job(media_type, content, message.chat_id, user_ids, rate=rate)
+        pacing = f" at {rate:.2f} messages/s" if rate else ""
+        status_message = message.reply_text(f"Broadcast #{job_id}: sending {label} to {len(user_ids)} users{pacing}...")
+        run_broadcast_job(bot, job_id, status_message)
 
-def save_user_id(user_id: str) -> None:
-    """Save a new user ID to the file."""
-    with open(USER_IDS_FILE, 'a') as file:
-        file.write(f"{user_id}\n")
 
 @admin_only
 def broadcast(update: Update, context: CallbackContext) -> None:
-    """Broadcast a message or media to all users."""
+    """Broadcast a message or media to all users, or to a segment, now, later or spread out (see BROADCAST_OPTIONS)."""
     if update.message:
         # Check if there's an image or other media attached
         if update.message.photo:
@@ -339,223 +732,592 @@ def broadcast(update: Update, context: CallbackContext) -> None:
             media_type = 'document'
         else:
             media_type = 'text'
-            media_file_id = ' '.join(context.args)  # For text messages
         
-        user_ids = load_user_ids()
-        for user_id in user_ids:
-            try:
-                if media_type == 'photo':
-                    context.bot.send_photo(chat_id=user_id, photo=media_file_id)
-                elif media_type == 'document':
-                    context.bot.send_document(chat_id=user_id, document=media_file_id)
-                else:
-                    context.bot.send_message(chat_id=user_id, text=media_file_id)
-            except Exception as e:
-                logger.error(f"Failed to send {media_type} to {user_id}: {e}")
-        
-        update.message.reply_text(f"{media_type.capitalize()} broadcasted to {len(user_ids)} users.")
+        try:
+            options, scheduled_at, args = parse_broadcast_options(context.args or [])
+        except ValueError as e:
+            update.message.reply_text(str(e))
+            return
+        if media_type == 'text':
+            media_file_id = ' '.join(args)  # For text messages
+            if not media_file_id:
+                update.message.reply_text(
+                    "Please provide the text to broadcast after any options, or attach a photo or document."
+                )
+                return
+        start_broadcast_job(context.bot, update.message, media_type, media_file_id, media_type, options, scheduled_at)
     else:
         logger.error("update.message is None in /broadcast handler")
 
 
-def read_sellers_list() -> str:
-    """Read the list of trusted sellers from a file."""
-    sellers_file_path = 'seller.txt'
-    if not os.path.exists(sellers_file_path):
-        return "Trusted sellers file not found."
-    
-    with open(sellers_file_path, 'r') as file:
-        return file.read()
+def parse_job_id(update: Update, context: CallbackContext):
+    """Return the job referenced by the command arguments, replying if it is missing."""
+    if not context.args or not context.args[0].isdigit():
+        update.message.reply_text("Please provide a broadcast job ID.")
+        return None
+    job = JOB_STORE.get_job(int(context.args[0]))
+    if job is None:
+        update.message.reply_text(f"Broadcast #{context.args[0]} not found.")
+    return job
+
+@admin_only
+def list_jobs(update: Update, context: CallbackContext) -> None:
+    """List the most recent broadcast jobs."""
+    jobs = JOB_STORE.list_jobs()
+    if not jobs:
+        update.message.reply_text("No broadcast jobs yet.")
+        return
+    lines = []
+    for job in jobs:
+        if job['status'] == SCHEDULED:
+            when = time.strftime('%Y-%m-%d %H:%M', time.localtime(job['scheduled_at']))
+            lines.append(f"#{job['id']} {job['media_type']} scheduled for {when}")
+            continue
+        counts = JOB_STORE.counts(job['id'])
+        lines.append(
+            f"#{job['id']} {job['media_type']} {job['status']}: {counts['delivered']}/{job['total']} delivered, "
+            f"{counts['failed']} failed, {counts['blocked']} blocked"
+        )
+    update.message.reply_text("\n".join(lines))
+
+@admin_only
+def pause_job(update: Update, context: CallbackContext) -> None:
+    """Pause a running broadcast job."""
+    job = parse_job_id(update, context)
+    if job is None:
+        return
+    if job['status'] != RUNNING:
+        update.message.reply_text(f"Broadcast #{job['id']} is {job['status']}, not running.")
+        return
+    # Under the lock so a run being started right now is either stopped here or never starts
+    with BROADCAST_LOCK:
+        JOB_STORE.set_status(job['id'], PAUSED)
+        run = RUNNING_JOBS.get(job['id'])
+        if run:
+            run.cancel()
+    update.message.reply_text(f"Broadcast #{job['id']} paused.")
+
+@admin_only
+def resume_job(update: Update, context: CallbackContext) -> None:
+    """Resume a paused broadcast job."""
+    job = parse_job_id(update, context)
+    if job is None:
+        return
+    if job['status'] != PAUSED:
+        update.message.reply_text(f"Broadcast #{job['id']} is {job['status']}, not paused.")
+        return
+    if job['id'] in RUNNING_JOBS:
+        update.message.reply_text(f"Broadcast #{job['id']} is still stopping, try again in a moment.")
+        return
+    status_message = update.message.reply_text(f"Broadcast #{job['id']}: resuming...")
+    if not run_broadcast_job(context.bot, job['id'], status_message, from_status=PAUSED):
+        status_message.edit_text(f"Broadcast #{job['id']} is no longer paused.")
+
+@admin_only
+def cancel_job(update: Update, context: CallbackContext) -> None:
+    """Cancel a broadcast job for good."""
+    job = parse_job_id(update, context)
+    if job is None:
+        return
+    if job['status'] in (CANCELLED, COMPLETED):
+        update.message.reply_text(f"Broadcast #{job['id']} is already {job['status']}.")
+        return
+    with BROADCAST_LOCK:
+        JOB_STORE.set_status(job['id'], CANCELLED)
+        run = RUNNING_JOBS.get(job['id'])
+        if run:
+            run.cancel()
+    update.message.reply_text(f"Broadcast #{job['id']} cancelled.")
+
+
+@admin_only
+def broadcast_config(update: Update, context: CallbackContext) -> None:
+    """Broadcast a config file as a document, uploading it at most once; takes the same options as /broadcast."""
+    if update.message:
+        args = context.args or []
+        name = 'config'
+        if args and not BROADCAST_OPTION_PATTERN.fullmatch(args[0]):
+            name, args = args[0], args[1:]
+        file_path = CONFIG_DOCUMENTS.get(name)
+        if file_path is None:
+            update.message.reply_text(f"Unknown config '{name}'. Choose one of: {', '.join(CONFIG_DOCUMENTS)}")
+            return
+        try:
+            options, scheduled_at, _ = parse_broadcast_options(args)
+        except ValueError as e:
+            update.message.reply_text(str(e))
+            return
+        # Sending it to the admin first makes sure there is a file_id to broadcast
+        message = send_config_document(context.bot, update.message.chat_id, file_path)
+        if message is None:
+            return
+        start_broadcast_job(context.bot, update.message, 'document', message.document.file_id, name, options, scheduled_at)
+    else:
+        logger.error("update.message is None in /broadcast_config handler")
+
+
+@admin_only
+def pruned_users(update: Update, context: CallbackContext) -> None:
+    """List users that broadcasts skip because they could no longer be reached."""
+    rows = USER_STORE.pruned()
+    if not rows:
+        update.message.reply_text("No pruned users.")
+        return
+    lines = [f"{len(USER_STORE.blocked)} pruned users, most recent first:"]
+    for row in rows:
+        lines.append(f"{row['user_id']}: {row['prune_reason'] or 'unknown reason'}")
+    lines.append("Restore with /restore_user <user_id> or /restore_user all")
+    update.message.reply_text("\n".join(lines))
+
+@admin_only
+def restore_user(update: Update, context: CallbackContext) -> None:
+    """Put pruned users back into the broadcast audience."""
+    if not context.args:
+        update.message.reply_text("Please provide user IDs to restore, or 'all'.")
+        return
+    if context.args[0] == 'all':
+        restored = USER_STORE.restore_all()
+    else:
+        restored = sum(USER_STORE.set_blocked(user_id, False) for user_id in context.args)
+    update.message.reply_text(f"Restored {restored} users.")
+
+
+@admin_only
+def stats(update: Update, context: CallbackContext) -> None:
+    """Show handler latency, throughput, errors and broadcast delivery counts."""
+    update.message.reply_text(stats_text())
+
 
 def trusted_sellers(update: Update, context: CallbackContext) -> None:
     """Handle /trusted_sellers command and send the list of trusted sellers with a delete button."""
     if update.message:
-        sellers_list = read_sellers_list()
-        keyboard = [
-            [InlineKeyboardButton("Delete", callback_data='delete_trusted_sellers')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        update.message.reply_text(sellers_list, parse_mode='Markdown', reply_markup=reply_markup)
+        send_page(update.message, SELLERS_CONTENT)
     else:
         logger.error("update.message is None in /trusted_sellers handler")
 
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
-from telegram.ext import CallbackContext
-import os
+# Texts served from files, pre-split into pages and keyed by name for page:<key>:<n> callbacks
+PAGED_CONTENT = {}
 
-def button(update: Update, context: CallbackContext) -> None:
-    """Handle button presses."""
-    query = update.callback_query
-    if query:
-        user_id = query.from_user.id
-        callback_data = query.data  # Extract callback data once
-
-        # Define the Back to Menu button
-        back_to_menu_button = InlineKeyboardButton("Back to Menu", callback_data='back_to_menu')
-
-        if callback_data == 'generate_key':
-            generate_warp_key(update, context)
-            query.answer()  # Acknowledge the callback
-        elif callback_data == 'show_config':
-            # Create keyboard for configuration options
-            config_keyboard = [
-                [InlineKeyboardButton("Config By RNG_TEAM", callback_data='rng')],
-                [InlineKeyboardButton("Config By PakyaVpn", callback_data='pakya'), InlineKeyboardButton("Config By Dxni", callback_data='dani')],
-                [back_to_menu_button]
-            ]
-            reply_markup = InlineKeyboardMarkup(config_keyboard)
-            
-            query.edit_message_text(
-                text="Select your VPN configuration:",
-                reply_markup=reply_markup
-            )
-            query.answer()  # Acknowledge the callback
-        elif callback_data == 'pakya':
-            # Handle "Button Pakya" choice
-            file_path = 'pakya.txt'
-            if os.path.exists(file_path):
-                with open(file_path, 'r') as file:
-                    file_contents = file.read()
-                
-                keyboard = [
-                    [back_to_menu_button]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                query.message.reply_text(
-                    text="Config By @anakjati567:\n" + file_contents,
-                    reply_markup=reply_markup
-                )
-            else:
-                keyboard = [
-                    [back_to_menu_button]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                query.message.reply_text(
-                    text="The file 'file.txt' does not exist.",
-                    reply_markup=reply_markup
-                )
-            query.answer()  # Acknowledge the callback
-        elif callback_data == 'rng':
-            # Handle "Button Pakya" choice
-            file_path = 'rng.txt'
-            if os.path.exists(file_path):
-                with open(file_path, 'r') as file:
-                    file_contents = file.read()
-                
-                keyboard = [
-                    [back_to_menu_button]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                query.message.reply_text(
-                    text="Config By RNG_TEAM:\n" + file_contents,
-                    reply_markup=reply_markup
-                )
-            else:
-                keyboard = [
-                    [back_to_menu_button]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                query.message.reply_text(
-                    text="The file 'file.txt' does not exist.",
-                    reply_markup=reply_markup
-                )
-            query.answer()  # Acknowledge the callback
-        elif callback_data == 'dani':
-            # Handle "Button Dani" choice
-            file_path = 'dani.txt'
-            if os.path.exists(file_path):
-                with open(file_path, 'r') as file:
-                    file_contents = file.read()
-                
-                keyboard = [
-                    [back_to_menu_button]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                query.message.reply_text(
-                    text="Config By @dnbizowner:\n" + file_contents,
-                    reply_markup=reply_markup
-                )
-            else:
-                keyboard = [
-                    [back_to_menu_button]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                query.message.reply_text(
-                    text="The file 'file.txt' does not exist.",
-                    reply_markup=reply_markup
+def register_content(key: str, file_path: str, **kwargs) -> PagedContent:
+    content = PagedContent(key, CONTENT_CACHE, file_path, **kwargs)
+    PAGED_CONTENT[key] = content
+    return content
+
+def send_page(message, content: PagedContent, number: int = 0, edit: bool = False) -> None:
+    """Send one page of a paged text, or replace the message's text with it."""
+    page = content.page(number)
+    if edit:
+        message.edit_text(page.text, parse_mode=page.parse_mode, reply_markup=page.reply_markup)
+    else:
+        message.reply_text(page.text, parse_mode=page.parse_mode, reply_markup=page.reply_markup)
+
+def send_config_document(bot, chat_id, file_path: str, caption: str = None, reply_markup=None):
+    """Send a config file as a document, uploading it only if this version has no cached file_id.
+
+    Returns the sent message, or None if the file does not exist.
+    """
+    entry = CONTENT_CACHE.get_entry(file_path)
+    if entry.text is None:
+        bot.send_message(chat_id=chat_id, text="Configuration file not found.", reply_markup=reply_markup)
+        return None
+    file_id = FILE_ID_CACHE.get(file_path, entry.stamp)
+    if file_id is None:
+        # Concurrent requests for a new version wait here for one upload instead of each uploading
+        with FILE_ID_CACHE.upload_lock(file_path):
+            file_id = FILE_ID_CACHE.get(file_path, entry.stamp)
+            if file_id is None:
+                message = bot.send_document(
+                    chat_id=chat_id, document=entry.text.encode(), filename=os.path.basename(file_path),
+                    caption=caption, reply_markup=reply_markup,
                 )
-            query.answer()  # Acknowledge the callback
-        elif callback_data == 'show_trusted_sellers':
-            sellers_list = read_sellers_list()
-            keyboard = [
-                [InlineKeyboardButton("Delete", callback_data='delete_trusted_sellers')],
-                [back_to_menu_button]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            query.message.edit_text(sellers_list, parse_mode='Markdown', reply_markup=reply_markup)
-            query.answer()  # Acknowledge the callback
-        elif callback_data == 'delete_key':
-            if user_id in ADMINS:
-                context.bot.delete_message(chat_id=query.message.chat_id, message_id=query.message.message_id)
-                keyboard = [
-                    [back_to_menu_button]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                query.message.reply_text(text="Message deleted.", reply_markup=reply_markup)
-            else:
-                query.answer("You don't have permission to use this button.")
-        elif callback_data == 'delete_trusted_sellers':
-            if user_id in ADMINS:
-                context.bot.delete_message(chat_id=query.message.chat_id, message_id=query.message.message_id)
-                keyboard = [
-                    [back_to_menu_button]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                query.message.reply_text(text="Trusted sellers list deleted.", reply_markup=reply_markup)
-            else:
-                query.answer("You don't have permission to use this button.")
-        elif callback_data == 'back_to_menu':
-            # Create the main menu keyboard again
-            main_menu_keyboard = [
-                [InlineKeyboardButton("Generate WARP Key", callback_data='generate_key')],
-                [InlineKeyboardButton("Config VPN", callback_data='show_config')],
-                [InlineKeyboardButton("Show Trusted Sellers", callback_data='show_trusted_sellers')]
-            ]
-            reply_markup = InlineKeyboardMarkup(main_menu_keyboard)
-            
-            query.message.edit_text(
-                text="Welcome back to the main menu. Please choose an option:",
-                reply_markup=reply_markup
+                FILE_ID_CACHE.set(file_path, entry.stamp, message.document.file_id)
+                return message
+    try:
+        return bot.send_document(chat_id=chat_id, document=file_id, caption=caption, reply_markup=reply_markup)
+    except BadRequest as e:
+        logger.error(f"Cached file_id for {file_path} was rejected, uploading again: {e}")
+        FILE_ID_CACHE.invalidate(file_path)
+        return send_config_document(bot, chat_id, file_path, caption, reply_markup)
+
+
+class ContentPage:
+    """A menu entry that replies with the contents of a text file."""
+    def __init__(self, data: str, label: str, file_path: str, title: str, row: int) -> None:
+        self.data = data
+        self.label = label
+        self.file_path = file_path
+        self.title = title
+        self.row = row
+        self.content = register_content(data, file_path, title=title, extra_rows=[[BACK_TO_MENU_BUTTON]])
+
+    def __call__(self, update: Update, context: CallbackContext) -> None:
+        query = update.callback_query
+        if CONFIG_DELIVERY == 'document':
+            send_config_document(
+                context.bot, query.message.chat_id, self.file_path, caption=self.title, reply_markup=MENUS['back']
             )
-            query.answer()  # Acknowledge the callback
         else:
-            logger.error(f"Unknown callback data: {callback_data}")
-            query.answer()  # Optionally acknowledge unknown callback data
+            send_page(query.message, self.content)
+        query.answer()  # Acknowledge the callback
+
+
+# VPN config providers shown under "Config VPN"; adding a provider only needs a new entry here
+CONFIG_PAGES = [
+    ContentPage('rng', "Config By RNG_TEAM", 'rng.txt', "Config By RNG_TEAM:", row=0),
+    ContentPage('pakya', "Config By PakyaVpn", 'pakya.txt', "Config By @anakjati567:", row=1),
+    ContentPage('dani', "Config By Dxni", 'dani.txt', "Config By @dnbizowner:", row=1),
+]
+
+build_menus(CONFIG_PAGES)
+
+# Config files that /broadcast_config can send, by name
+CONFIG_DOCUMENTS = {'config': CONFIG_FILE_PATH, **{page.data: page.file_path for page in CONFIG_PAGES}}
+
+CONFIG_CONTENT = register_content(
+    'config', CONFIG_FILE_PATH, parse_mode='Markdown',
+    extra_rows=MENUS['config'].inline_keyboard, missing_text="Configuration file not found.",
+)
+SELLERS_CONTENT = register_content(
+    'sellers', SELLERS_FILE_PATH, parse_mode='Markdown',
+    extra_rows=MENUS['sellers'].inline_keyboard, missing_text="Trusted sellers file not found.",
+)
+SELLERS_MENU_CONTENT = register_content(
+    'sellers_menu', SELLERS_FILE_PATH, parse_mode='Markdown',
+    extra_rows=MENUS['sellers_with_back'].inline_keyboard, missing_text="Trusted sellers file not found.",
+)
+
+ROUTER = CallbackRouter(observe=lambda route, seconds: CALLBACK_SECONDS.observe(seconds, route))
+
+
+@ROUTER.route('generate_key')
+def generate_key_button(update: Update, context: CallbackContext) -> None:
+    """Generate a WARP key from the menu; generate_warp_key acknowledges the callback."""
+    generate_warp_key(update, context)
+
+
+@ROUTER.route('show_config')
+def show_config_menu(update: Update, context: CallbackContext) -> None:
+    """Show the list of VPN config providers."""
+    query = update.callback_query
+    query.edit_message_text(
+        text=CONFIG_MENU_TEXT,
+        reply_markup=MENUS['config_providers']
+    )
+    query.answer()  # Acknowledge the callback
+
+
+@ROUTER.route('show_trusted_sellers')
+def show_trusted_sellers(update: Update, context: CallbackContext) -> None:
+    """Show the trusted sellers list in place of the menu."""
+    query = update.callback_query
+    send_page(query.message, SELLERS_MENU_CONTENT, edit=True)
+    query.answer()  # Acknowledge the callback
+
+
+@ROUTER.route('noop')
+def noop_button(update: Update, context: CallbackContext) -> None:
+    """Acknowledge buttons that only display information, like page counters."""
+    update.callback_query.answer()
+
+
+def show_page(update: Update, context: CallbackContext, argument: str) -> None:
+    """Flip a paged text to the requested page in place."""
+    query = update.callback_query
+    key, _, number = argument.rpartition(':')
+    content = PAGED_CONTENT.get(key)
+    if content is None or not number.isdigit():
+        logger.error(f"Unknown page callback data: {query.data}")
+    else:
+        send_page(query.message, content, int(number), edit=True)
+    query.answer()
+
+
+def delete_message_button(confirmation: str):
+    """Build a handler that lets admins delete the message carrying the button."""
+    def handler(update: Update, context: CallbackContext) -> None:
+        query = update.callback_query
+        if ROLES.has(query.from_user.id, ADMIN):
+            context.bot.delete_message(chat_id=query.message.chat_id, message_id=query.message.message_id)
+            query.message.reply_text(text=confirmation, reply_markup=MENUS['back'])
+        else:
+            query.answer("You don't have permission to use this button.")
+    return handler
+
+
+@ROUTER.route('back_to_menu')
+def back_to_menu(update: Update, context: CallbackContext) -> None:
+    """Return to the main menu."""
+    query = update.callback_query
+    query.message.edit_text(
+        text=MAIN_MENU_TEXT,
+        reply_markup=MENUS['main']
+    )
+    query.answer()  # Acknowledge the callback
+
+
+ROUTER.add('delete_key', delete_message_button("Message deleted."))
+ROUTER.add('delete_trusted_sellers', delete_message_button("Trusted sellers list deleted."))
+ROUTER.add_prefix('page', show_page)
+for page in CONFIG_PAGES:
+    ROUTER.add(page.data, page)
+
+# Menus whose first open is recorded per user, for never=<menu> broadcast segments
+TRACKED_MENUS = {'show_config', 'show_trusted_sellers', *(page.data for page in CONFIG_PAGES)}
+
+
+def button(update: Update, context: CallbackContext) -> None:
+    """Handle button presses."""
+    if update.callback_query:
+        if update.callback_query.data in TRACKED_MENUS:
+            USER_STORE.record_menu_open(update.callback_query.from_user.id, update.callback_query.data)
+        ROUTER.dispatch(update, context)
     else:
         logger.error("update.callback_query is None in button handler")
 
 
 
+# How updates reach the bot: 'polling' (default) or 'webhook' behind the reverse proxy
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # Public URL registered with Telegram
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # Required in webhook mode, checked on every request
+
+# Handlers run on a pool so one slow reply doesn't hold up other chats;
+# updates from the same chat still run one at a time, in order
+HANDLER_WORKERS = 16
+HANDLER_QUEUE_LIMIT = 1000
+HANDLER_POOL = ChatOrderedPool(workers=HANDLER_WORKERS, max_queue=HANDLER_QUEUE_LIMIT)
+QUEUE_DEPTH.read = lambda: HANDLER_POOL.depth
+
+# Per-user flood control, applied before any handler work; admins are exempt
+FLOOD_LIMIT = 20  # updates per user...
+FLOOD_WINDOW = 10  # ...within this many seconds
+CALLBACK_COALESCE_WINDOW = 1.0  # same button pressed again within this many seconds is answered once
+SLOW_DOWN_TEXT = "You're going too fast, please slow down."
+FLOOD_LIMITER = SlidingWindowLimiter(FLOOD_LIMIT, FLOOD_WINDOW)
+CALLBACK_COALESCER = CallbackCoalescer(CALLBACK_COALESCE_WINDOW)
+
+# Seconds a shutdown may spend finishing handlers and stopping broadcasts
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', '20'))
+
+# Prometheus-style metrics on a local port; set METRICS_PORT=0 to turn the endpoint off.
+# Sharded processes share a host, so the ingress uses METRICS_PORT and worker N uses METRICS_PORT + 1 + N
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9464'))
+if METRICS_PORT and SHARD_COUNT > 1 and SHARD_ROLE == 'worker':
+    METRICS_PORT += 1 + SHARD_INDEX
+
+
+def pooled(callback):
+    """Time a handler and run it on the handler pool, tagging its log records with the update ID."""
+    timed = HANDLER_SECONDS.time(callback.__name__)(callback)
+
+    @wraps(callback)
+    def run(update: Update, context: CallbackContext, *args, **kwargs):
+        with correlation(f"update-{update.update_id}" if update else None, LOG_DEBUG_SAMPLE_RATE):
+            return timed(update, context, *args, **kwargs)
+    return HANDLER_POOL.wrap(run)
+
+
+def count_update(update: Update, context: CallbackContext) -> None:
+    """Count every update and keep last_seen current for active=<duration> broadcast segments."""
+    UPDATES.inc()
+    if update.effective_user:
+        USER_STORE.touch(update.effective_user.id)
+
+
+def flood_gate(update: Update, context: CallbackContext) -> None:
+    """Answer repeated button presses and over-limit users cheaply instead of running handlers."""
+    user = update.effective_user
+    if user is None or ROLES.has(user.id, ADMIN):
+        return
+    query = update.callback_query
+    if query and CALLBACK_COALESCER.is_duplicate(user.id, query.data):
+        THROTTLED.inc('duplicate')
+        HANDLER_POOL.submit(chat_key(update), query.answer)
+        raise DispatcherHandlerStop
+    if not FLOOD_LIMITER.allow(user.id):
+        THROTTLED.inc('rate')
+        if query:
+            HANDLER_POOL.submit(chat_key(update), query.answer, SLOW_DOWN_TEXT)
+        elif update.effective_message and FLOOD_LIMITER.warn_due(user.id):
+            HANDLER_POOL.submit(chat_key(update), update.effective_message.reply_text, SLOW_DOWN_TEXT)
+        raise DispatcherHandlerStop
+
+
+def register_handlers(dispatcher) -> None:
+    """Register every command and callback handler on the dispatcher."""
+    dispatcher.add_handler(TypeHandler(Update, count_update), group=-2)
+    dispatcher.add_handler(TypeHandler(Update, flood_gate), group=-1)
+    dispatcher.add_handler(CommandHandler('start', pooled(start)))
+    dispatcher.add_handler(CommandHandler('config', pooled(config)))
+    dispatcher.add_handler(CommandHandler('trusted_sellers', pooled(trusted_sellers)))
+    dispatcher.add_handler(CommandHandler('update_trusted_sellers', pooled(update_trusted_sellers)))
+    dispatcher.add_handler(CommandHandler('broadcast', pooled(broadcast)))  # Add the broadcast command handler
+    dispatcher.add_handler(CallbackQueryHandler(pooled(button)))
+    dispatcher.add_handler(CommandHandler('update_config', pooled(update_config)))
+    dispatcher.add_handler(CommandHandler('jobs', pooled(list_jobs)))
+    dispatcher.add_handler(CommandHandler('pause_job', pooled(pause_job)))
+    dispatcher.add_handler(CommandHandler('resume_job', pooled(resume_job)))
+    dispatcher.add_handler(CommandHandler('cancel_job', pooled(cancel_job)))
+    dispatcher.add_handler(CommandHandler('stats', pooled(stats)))
+    dispatcher.add_handler(CommandHandler('broadcast_config', pooled(broadcast_config)))
+    dispatcher.add_handler(CommandHandler('pruned', pooled(pruned_users)))
+    dispatcher.add_handler(CommandHandler('restore_user', pooled(restore_user)))
+    dispatcher.add_handler(CommandHandler('history', pooled(content_history)))
+    dispatcher.add_handler(CommandHandler('rollback', pooled(rollback_content)))
+    dispatcher.add_handler(CommandHandler('grant', pooled(grant_role)))
+    dispatcher.add_handler(CommandHandler('revoke', pooled(revoke_role)))
+    dispatcher.add_handler(CommandHandler('roles', pooled(list_roles)))
+
+
+def checkpoint_broadcasts(timeout: float) -> None:
+    """Stop running broadcasts once their in-flight sends finish, leaving them to resume on the next start."""
+    runs = list(RUNNING_JOBS.items())
+    for job_id, run in runs:
+        run.cancel()
+    deadline = time.monotonic() + timeout
+    for job_id, run in runs:
+        if not run.wait(max(0.0, deadline - time.monotonic())):
+            logger.warning(f"Broadcast #{job_id} did not stop in time; its last sends may be repeated on resume")
+
+
+def warm_up(bot) -> None:
+    """Load what the first requests would otherwise load: content pages, config files, roles and the bot's identity."""
+    pages = sum(len(content.pages()) for content in PAGED_CONTENT.values())
+    for file_path in CONFIG_DOCUMENTS.values():
+        CONTENT_CACHE.get_entry(file_path)
+    ROLES.members(ADMIN)
+    # Command handlers need the bot's username; fetch it now instead of during the first /start
+    bot.get_me()
+    logger.info(f"Warmed up {pages} content pages, {len(MENUS)} menus and {len(USER_STORE)} users")
+
+
+def start_webhook(updater: Updater) -> WebhookServer:
+    """Receive updates through the local webhook server instead of polling."""
+    server = WebhookServer(
+        updater.bot, updater.update_queue, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET
+    )
+    server.start()
+    threading.Thread(target=updater.dispatcher.start, name="dispatcher", daemon=True).start()
+    if WEBHOOK_URL:
+        updater.bot.set_webhook(url=WEBHOOK_URL, api_kwargs={'secret_token': WEBHOOK_SECRET})
+    # Lets updater.stop() stop the dispatcher
+    updater.running = True
+    return server
+
+
+def wait_for_stop_signal() -> None:
+    """Block until SIGINT, SIGTERM or SIGABRT."""
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGABRT):
+        signal.signal(signum, lambda signum, frame: stop.set())
+    while not stop.wait(1):
+        pass
+
+
+def forward_update(update: Update, context: CallbackContext) -> None:
+    """Queue an update for the worker process that owns its chat."""
+    UPDATES.inc()
+    SHARD_QUEUE.put(shard_of(update, SHARD_COUNT), update.to_json())
+
+
+def start_shard_worker(updater: Updater) -> ShardConsumer:
+    """Handle this worker's shard of the updates queued by the ingress process."""
+    def deliver(payload: str) -> None:
+        updater.update_queue.put(Update.de_json(json.loads(payload), updater.bot))
+
+    consumer = ShardConsumer(SHARD_QUEUE, SHARD_INDEX, deliver)
+    threading.Thread(target=updater.dispatcher.start, name="dispatcher", daemon=True).start()
+    consumer.start()
+    # Lets updater.stop() stop the dispatcher
+    updater.running = True
+    return consumer
+
+
+def shutdown(updater: Updater, intake=None, metrics: MetricsServer = None) -> None:
+    """Stop taking updates, finish the ones already received and checkpoint background work.
+
+    intake is the webhook server or shard consumer feeding the dispatcher, or None when polling.
+    """
+    started = time.monotonic()
+    deadline = started + SHUTDOWN_TIMEOUT
+    logger.info("Shutting down")
+    # Telegram keeps webhook updates we don't accept and redelivers them later,
+    # and updates left in the shard queue wait for this worker's next start
+    if intake:
+        intake.stop()
+    # Stops polling; the dispatcher hands every update already received to the pool before it stops
+    updater.stop()
+    drained = HANDLER_POOL.shutdown(max(0.0, deadline - time.monotonic()))
+    if not drained:
+        # Leave the updates unconfirmed so Telegram sends them again after the restart
+        logger.warning("Shutdown deadline reached with handlers still running")
+    elif intake is None and updater.last_update_id and updater.update_queue.empty():
+        # Confirm the handled updates so Telegram doesn't send them again after the restart
+        try:
+            updater.bot.get_updates(offset=updater.last_update_id, limit=1, timeout=0)
+        except Exception as e:
+            logger.error(f"Failed to confirm handled updates: {e}")
+    checkpoint_broadcasts(max(0.0, deadline - time.monotonic()))
+    NEW_USER_DIGEST.stop(max(0.0, deadline - time.monotonic()))
+    if metrics:
+        metrics.stop()
+    logger.info(f"Shut down in {time.monotonic() - started:.1f}s")
+    LOG_LISTENER.stop()
+
+
 def main():
     """Start the bot."""
-    updater = Updater('7287462728:AAHZpXDQekc3r7uXETteSmoNpnS23OfodN0')  # Replace with your actual bot token
-    
-    # Get the dispatcher to register handlers
-    dispatcher = updater.dispatcher
-    
-    # Add handlers
-    dispatcher.add_handler(CommandHandler('start', start))
-    dispatcher.add_handler(CommandHandler('config', config))
-    dispatcher.add_handler(CommandHandler('trusted_sellers', trusted_sellers))
-    dispatcher.add_handler(CommandHandler('update_trusted_sellers', update_trusted_sellers))
-    dispatcher.add_handler(CommandHandler('broadcast', broadcast))  # Add the broadcast command handler
-    dispatcher.add_handler(CallbackQueryHandler(button))
-    dispatcher.add_handler(CommandHandler('update_config', update_config))
+    sharded_worker = SHARD_COUNT > 1 and SHARD_ROLE == 'worker'
+    if BOT_MODE == 'webhook' and not sharded_worker and not WEBHOOK_SECRET:
+        # Without the secret anyone who can reach the webhook could send updates as an admin
+        logger.error("BOT_MODE=webhook requires WEBHOOK_SECRET to be set")
+        LOG_LISTENER.stop()
+        raise SystemExit(1)
+    # Leave room in the connection pool for the handler and broadcast workers
+    bot = MeteredBot(
+        '7287462728:AAHZpXDQekc3r7uXETteSmoNpnS23OfodN0',  # Replace with your actual bot token
+        request=Request(con_pool_size=HANDLER_WORKERS + BROADCAST_WORKERS + 8),
+    )
+    updater = Updater(bot=bot)
+    # Bind the metrics port first, so a port clash stops the process before it resumes any work
+    metrics = None
+    if METRICS_PORT:
+        metrics = MetricsServer(METRICS_LISTEN, METRICS_PORT)
+        metrics.start()
     
-    # Start polling
-    updater.start_polling()
-    updater.idle()
+    if SHARD_COUNT > 1 and SHARD_ROLE == 'ingress':
+        # Only receives updates and queues them for the workers
+        updater.dispatcher.add_handler(TypeHandler(Update, forward_update))
+    else:
+        # Get the dispatcher to register handlers
+        register_handlers(updater.dispatcher)
+        warm_up(updater.bot)
+
+        # Pick up broadcasts and admin alerts that were interrupted by a restart
+        resume_interrupted_jobs(updater.bot)
+        NEW_USER_DIGEST.start(lambda message: notify_admins(updater.bot, message))
+
+    intake = None
+    broadcast_poll_stopped = threading.Event()
+    if not (SHARD_COUNT > 1 and SHARD_ROLE == 'ingress'):
+        threading.Thread(
+            target=poll_broadcasts, args=(updater.bot, broadcast_poll_stopped), name="broadcast-poll", daemon=True
+        ).start()
+    if sharded_worker:
+        intake = start_shard_worker(updater)
+    elif BOT_MODE == 'webhook':
+        intake = start_webhook(updater)
+    else:
+        updater.start_polling()
+    logger.info(f"Started in {time.perf_counter() - STARTUP_STARTED:.2f}s")
+    wait_for_stop_signal()
+    broadcast_poll_stopped.set()
+    shutdown(updater, intake, metrics)
 
 
 
@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import threading
+from typing import Callable
+
+logger = logging.getLogger("WarpGeneratorNG")
+
+
+class NewUserDigest:
+    """Collects new-user alerts and hands them off as one digest every interval or max_batch users.
+
+    With a state_path, alerts still pending at stop() are saved there instead of
+    being sent, and start() picks them up again.
+    """
+    def __init__(self, interval: float = 60.0, max_batch: int = 25, state_path: str = None) -> None:
+        self.interval = interval
+        self.max_batch = max_batch
+        self.state_path = state_path
+        self.pending = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.send = None
+        self.thread = None
+
+    def add(self, user_id: str, user_name: str) -> None:
+        with self.lock:
+            self.pending.append((user_id, user_name))
+            if len(self.pending) >= self.max_batch:
+                self.wakeup.set()
+
+    def start(self, send: Callable) -> None:
+        """Start sending digests through send(text) from a background thread."""
+        self.send = send
+        self.restore()
+        self.thread = threading.Thread(target=self._run, name="new-user-digest", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = None) -> None:
+        """Stop the background thread, then checkpoint or send whatever is pending."""
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join(timeout)
+        if self.state_path:
+            self.checkpoint()
+        else:
+            while self.pending:
+                self.flush()
+
+    def checkpoint(self) -> None:
+        """Save pending alerts to state_path so the next start() sends them."""
+        with self.lock:
+            pending = list(self.pending)
+        if not pending:
+            return
+        temp_path = f"{self.state_path}.tmp"
+        try:
+            with open(temp_path, 'w') as file:
+                json.dump(pending, file)
+            os.replace(temp_path, self.state_path)
+            logger.info(f"Saved {len(pending)} pending new user alerts to {self.state_path}")
+        except IOError as e:
+            logger.error(f"Failed to save pending new user alerts: {e}")
+
+    def restore(self) -> None:
+        """Queue alerts saved by checkpoint() ahead of new ones."""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'r') as file:
+                saved = [tuple(alert) for alert in json.load(file)]
+            os.remove(self.state_path)
+        except (IOError, ValueError) as e:
+            logger.error(f"Failed to load pending new user alerts: {e}")
+            return
+        with self.lock:
+            self.pending[:0] = saved
+            if len(self.pending) >= self.max_batch:
+                self.wakeup.set()
+
+    def flush(self) -> None:
+        with self.lock:
+            batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+            if len(self.pending) >= self.max_batch:
+                self.wakeup.set()
+        if not batch:
+            return
+        try:
+            self.send(format_digest(batch))
+        except Exception as e:
+            logger.error(f"Failed to send new user digest for {len(batch)} users: {e}")
+
+    def _run(self) -> None:
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            if not self.stopped.is_set():
+                self.flush()
+
+
+def format_digest(batch: list) -> str:
+    lines = [f"**New User Alert!** ({len(batch)} new)"]
+    for user_id, user_name in batch:
+        user_name = (user_name or '').replace('`', "'")
+        lines.append(f"`{user_id}` - `{user_name}`")
+    return "\n".join(lines)
@@ -0,0 +1,151 @@
+import logging
+import threading
+from typing import List, Optional
+
+from telegram import InlineKeyboardButton
+
+from content_cache import ContentCache
+from menus import FrozenKeyboard
+
+logger = logging.getLogger("WarpGeneratorNG")
+
+# Telegram's limit for a text message, counted in UTF-16 code units
+MESSAGE_LIMIT = 4096
+
+
+def utf16_len(text: str) -> int:
+    return len(text.encode('utf-16-le')) // 2
+
+
+def markdown_is_valid(text: str) -> bool:
+    """Check that text parses as Telegram's legacy Markdown (every entity is closed)."""
+    i = 0
+    n = len(text)
+    open_entity = None
+    while i < n:
+        if open_entity in ('`', '```'):
+            if text.startswith(open_entity, i):
+                i += len(open_entity)
+                open_entity = None
+            else:
+                i += 1
+            continue
+        c = text[i]
+        if c == '\\' and open_entity is None and i + 1 < n and text[i + 1] in '_*`[':
+            i += 2
+        elif open_entity is None and text.startswith('```', i):
+            open_entity = '```'
+            i += 3
+        elif open_entity is None and c == '`':
+            open_entity = '`'
+            i += 1
+        elif c in '*_':
+            if open_entity is None:
+                open_entity = c
+            elif open_entity == c:
+                open_entity = None
+            i += 1
+        elif open_entity is None and c == '[':
+            middle = text.find('](', i)
+            end = text.find(')', middle + 2) if middle != -1 else -1
+            if end == -1:
+                return False
+            i = end + 1
+        else:
+            i += 1
+    return open_entity is None
+
+
+def split_text(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Split text into chunks under the limit, preferring line boundaries."""
+    chunks = []
+    current = ''
+    for line in text.splitlines(keepends=True):
+        if utf16_len(current) + utf16_len(line) <= limit:
+            current += line
+            continue
+        if current:
+            chunks.append(current)
+            current = ''
+        while utf16_len(line) > limit:
+            # A single line longer than a whole page is cut by characters
+            cut = limit
+            while utf16_len(line[:cut]) > limit:
+                cut -= 1
+            chunks.append(line[:cut])
+            line = line[cut:]
+        current = line
+    if current or not chunks:
+        chunks.append(current)
+    return [chunk.strip('\n') or '-' for chunk in chunks]
+
+
+class Page:
+    """One ready-to-send message of a paged text."""
+    def __init__(self, text: str, parse_mode: Optional[str], reply_markup: FrozenKeyboard) -> None:
+        self.text = text
+        self.parse_mode = parse_mode
+        self.reply_markup = reply_markup
+
+
+class PagedContent:
+    """A text file served as one or more pages, re-split only when the file changes.
+
+    Pages whose Markdown does not parse are sent as plain text so a send never
+    fails, and multi-page texts get Prev/Next buttons with ``page:<key>:<n>``
+    callback data.
+    """
+    def __init__(self, key: str, cache: ContentCache, file_path: str, title: str = None,
+                 parse_mode: str = None, extra_rows: tuple = (), missing_text: str = None,
+                 limit: int = MESSAGE_LIMIT) -> None:
+        self.key = key
+        self.cache = cache
+        self.file_path = file_path
+        self.title = title
+        self.parse_mode = parse_mode
+        self.extra_rows = [list(row) for row in extra_rows]
+        self.missing_text = missing_text or f"The file '{file_path}' does not exist."
+        self.limit = limit
+        self.lock = threading.Lock()
+        self._entry = None
+        self._pages = None
+
+    def pages(self) -> List[Page]:
+        entry = self.cache.get_entry(self.file_path)
+        if entry is not self._entry:
+            with self.lock:
+                if entry is not self._entry:
+                    self._pages = self._build(entry.text)
+                    self._entry = entry
+        return self._pages
+
+    def page(self, number: int) -> Page:
+        pages = self.pages()
+        return pages[max(0, min(number, len(pages) - 1))]
+
+    def _build(self, text: Optional[str]) -> List[Page]:
+        if text is None:
+            return [Page(self.missing_text, None, FrozenKeyboard(self.extra_rows))]
+        if self.title:
+            text = f"{self.title}\n" + text
+        chunks = split_text(text, self.limit)
+        pages = []
+        for number, chunk in enumerate(chunks):
+            parse_mode = self.parse_mode
+            if parse_mode == 'Markdown' and not markdown_is_valid(chunk):
+                logger.warning(f"Page {number + 1} of {self.file_path} is not valid Markdown, sending it as plain text")
+                parse_mode = None
+            rows = list(self.extra_rows)
+            if len(chunks) > 1:
+                rows.insert(0, self._navigation(number, len(chunks)))
+            pages.append(Page(chunk, parse_mode, FrozenKeyboard(rows)))
+        return pages
+
+    def _navigation(self, number: int, total: int) -> list:
+        row = []
+        if number > 0:
+            row.append(InlineKeyboardButton("« Prev", callback_data=f"page:{self.key}:{number - 1}"))
+        row.append(InlineKeyboardButton(f"{number + 1}/{total}", callback_data='noop'))
+        if number < total - 1:
+            row.append(InlineKeyboardButton("Next »", callback_data=f"page:{self.key}:{number + 1}"))
+        return row
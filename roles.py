@@ -0,0 +1,130 @@
+import logging
+import threading
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+from content_store import ContentStore
+
+logger = logging.getLogger("WarpGeneratorNG")
+
+ADMIN = 'admin'
+
+FILE_HEADER = "# <user_id> [role ...] per line; a user listed without roles is an admin\n"
+
+
+def _split_line(line: str) -> Tuple[list, str]:
+    """Split a roles file line into its fields and its comment, including the '#'."""
+    content, sep, comment = line.partition('#')
+    return content.split(), sep + comment
+
+
+def _format_line(user_id: int, roles: set, comment: str) -> str:
+    return ' '.join([str(user_id), *sorted(roles)] + ([comment] if comment else []))
+
+
+def parse_assignments(text: str) -> Dict[int, set]:
+    """Parse the roles file into user ID -> set of roles."""
+    assignments = {}
+    for number, line in enumerate(text.splitlines(), 1):
+        fields, _ = _split_line(line)
+        if not fields:
+            continue
+        if not fields[0].isdigit():
+            logger.error(f"Ignoring line {number} of the roles file: {line!r}")
+            continue
+        assignments.setdefault(int(fields[0]), set()).update(fields[1:] or [ADMIN])
+    return assignments
+
+
+def update_assignments(text: str, user_id: int, role: str, granted: bool) -> Optional[str]:
+    """Grant or revoke one role in the roles file text, leaving every other line as it is.
+
+    Returns None if the user already had (or didn't have) the role.
+    """
+    lines = text.splitlines()
+    user_lines = []
+    for index, line in enumerate(lines):
+        fields, comment = _split_line(line)
+        if fields and fields[0].isdigit() and int(fields[0]) == user_id:
+            user_lines.append((index, set(fields[1:] or [ADMIN]), comment))
+    if any(role in roles for _, roles, _ in user_lines) == granted:
+        return None
+    if granted and user_lines:
+        index, roles, comment = user_lines[0]
+        lines[index] = _format_line(user_id, roles | {role}, comment)
+    elif granted:
+        if not lines:
+            lines.append(FILE_HEADER.rstrip('\n'))
+        lines.append(_format_line(user_id, {role}, ''))
+    else:
+        removed = set()
+        for index, roles, comment in user_lines:
+            if role not in roles:
+                continue
+            if roles - {role}:
+                lines[index] = _format_line(user_id, roles - {role}, comment)
+            elif comment:
+                lines[index] = comment
+            else:
+                removed.add(index)
+        lines = [line for index, line in enumerate(lines) if index not in removed]
+    return "\n".join(lines) + "\n"
+
+
+class RoleStore:
+    """User roles read from a text file into sets and reloaded whenever the file changes.
+
+    Owners always hold the admin role so a bad edit can't lock everyone out.
+    Admins pass every role check.
+    """
+    def __init__(self, path: str, store: ContentStore, owners: Iterable[int] = ()) -> None:
+        self.path = path
+        self.store = store
+        self.owners = frozenset(int(user_id) for user_id in owners)
+        self.entry = None
+        self.roles = {ADMIN: self.owners}
+        self.lock = threading.Lock()
+
+    def _current(self) -> Dict[str, FrozenSet[int]]:
+        entry = self.store.cache.get_entry(self.path)
+        if entry is not self.entry:
+            with self.lock:
+                if entry is not self.entry:
+                    self.roles = self._build(parse_assignments(entry.text or ''))
+                    self.entry = entry
+        return self.roles
+
+    def _build(self, assignments: Dict[int, set]) -> Dict[str, FrozenSet[int]]:
+        roles = {ADMIN: set(self.owners)}
+        for user_id, user_roles in assignments.items():
+            for role in user_roles:
+                roles.setdefault(role, set()).add(user_id)
+        return {role: frozenset(user_ids) for role, user_ids in roles.items()}
+
+    def has(self, user_id, role: str = ADMIN) -> bool:
+        roles = self._current()
+        user_id = int(user_id)
+        return user_id in roles[ADMIN] or user_id in roles.get(role, ())
+
+    def members(self, role: str = ADMIN) -> FrozenSet[int]:
+        return self._current().get(role, frozenset())
+
+    def all_roles(self) -> Dict[str, FrozenSet[int]]:
+        return dict(self._current())
+
+    def grant(self, user_id, role: str = ADMIN, author=None) -> bool:
+        """Give a user a role and return False if they already had it."""
+        return self._update(int(user_id), role, True, author)
+
+    def revoke(self, user_id, role: str = ADMIN, author=None) -> bool:
+        """Take a role from a user and return False if they didn't have it."""
+        return self._update(int(user_id), role, False, author)
+
+    def _update(self, user_id: int, role: str, granted: bool, author) -> bool:
+        with self.lock:
+            # Read the file itself, not the cached copy, so a hand edit made just before isn't overwritten
+            self.store.cache.invalidate(self.path)
+            text = update_assignments(self.store.cache.get(self.path) or '', user_id, role, granted)
+            if text is None:
+                return False
+            self.store.write(self.path, text, author)
+        return True
@@ -0,0 +1,72 @@
+import logging
+import re
+import time
+from typing import Callable, Optional, Tuple
+
+logger = logging.getLogger("WarpGeneratorNG")
+
+
+class CallbackRouter:
+    """Dispatches callback queries by their callback_data.
+
+    Exact routes and prefix routes are dict lookups, so dispatch cost does not
+    grow with the number of menu items. Prefix routes match data of the form
+    ``<prefix><separator><argument>`` and receive the argument. Pattern routes
+    are tried in order only when nothing else matched and receive the match.
+    If given, observe(route, seconds) is called after every dispatched callback.
+    """
+    def __init__(self, separator: str = ':', observe: Callable = None) -> None:
+        self.separator = separator
+        self.observe = observe
+        self.routes = {}
+        self.prefixes = {}
+        self.patterns = []
+        self.fallback = None
+
+    def add(self, data: str, handler: Callable) -> None:
+        self.routes[data] = handler
+
+    def add_prefix(self, prefix: str, handler: Callable) -> None:
+        self.prefixes[prefix] = handler
+
+    def add_pattern(self, pattern: str, handler: Callable) -> None:
+        self.patterns.append((re.compile(pattern), handler))
+
+    def set_fallback(self, handler: Callable) -> None:
+        self.fallback = handler
+
+    def route(self, data: str) -> Callable:
+        """Decorator form of add()."""
+        def decorator(handler):
+            self.add(data, handler)
+            return handler
+        return decorator
+
+    def resolve(self, data: str) -> Tuple[str, Optional[Callable], tuple]:
+        """Return the route name, its handler and the extra arguments to pass it."""
+        handler = self.routes.get(data)
+        if handler is not None:
+            return data, handler, ()
+        prefix, separator, argument = data.partition(self.separator)
+        if separator:
+            handler = self.prefixes.get(prefix)
+            if handler is not None:
+                return prefix + separator, handler, (argument,)
+        for pattern, handler in self.patterns:
+            match = pattern.fullmatch(data)
+            if match:
+                return pattern.pattern, handler, (match,)
+        return 'unknown', self.fallback, ()
+
+    def dispatch(self, update, context) -> None:
+        start = time.perf_counter()
+        route, handler, args = self.resolve(update.callback_query.data or '')
+        try:
+            if handler is None:
+                logger.error(f"Unknown callback data: {update.callback_query.data}")
+                update.callback_query.answer()
+            else:
+                handler(update, context, *args)
+        finally:
+            if self.observe:
+                self.observe(route, time.perf_counter() - start)
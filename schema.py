@@ -0,0 +1,10 @@
+import sqlite3
+
+
+def add_missing_columns(conn: sqlite3.Connection, table: str, columns: dict) -> None:
+    """Add the columns ({name: type}) that a database created by an older release lacks."""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    with conn:
+        for name, column_type in columns.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
@@ -0,0 +1,167 @@
+import logging
+import sqlite3
+import threading
+import time
+from typing import List, Tuple
+
+logger = logging.getLogger("WarpGeneratorNG")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS updates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    shard INTEGER NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS updates_shard ON updates (shard, id);
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+
+def connect(path: str) -> sqlite3.Connection:
+    # Autocommit mode, so transactions are opened explicitly with BEGIN IMMEDIATE
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def shard_of(update, shards: int) -> int:
+    """Shard that handles an update: its chat ID modulo the number of shards."""
+    if update.effective_chat:
+        return update.effective_chat.id % shards
+    if update.effective_user:
+        return update.effective_user.id % shards
+    return 0
+
+
+class ShardQueue:
+    """Updates waiting for their shard's worker process, kept in SQLite."""
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = connect(path)
+
+    def put(self, shard: int, payload: str) -> None:
+        with self.lock:
+            self.conn.execute("INSERT INTO updates (shard, payload) VALUES (?, ?)", (shard, payload))
+
+    def take(self, shard: int, limit: int = 100) -> List[Tuple[int, str]]:
+        """Remove and return the oldest updates of a shard, in arrival order."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.conn.execute(
+                    "SELECT id, payload FROM updates WHERE shard = ? ORDER BY id LIMIT ?", (shard, limit)
+                ).fetchall()
+                if rows:
+                    self.conn.execute("DELETE FROM updates WHERE shard = ? AND id <= ?", (shard, rows[-1][0]))
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def depth(self, shard: int = None) -> int:
+        with self.lock:
+            if shard is None:
+                return self.conn.execute("SELECT COUNT(*) FROM updates").fetchone()[0]
+            return self.conn.execute("SELECT COUNT(*) FROM updates WHERE shard = ?", (shard,)).fetchone()[0]
+
+
+class ShardConsumer:
+    """Moves one shard's updates from the shared queue into this process's dispatcher."""
+    def __init__(self, shard_queue: ShardQueue, shard: int, deliver, poll_interval: float = 0.05) -> None:
+        self.shard_queue = shard_queue
+        self.shard = shard
+        self.deliver = deliver
+        self.poll_interval = poll_interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self._run, name=f"shard-{self.shard}", daemon=True)
+        self.thread.start()
+        logger.info(f"Consuming updates for shard {self.shard}")
+
+    def stop(self) -> None:
+        """Stop taking updates; those already taken are delivered before this returns."""
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+
+    def _run(self) -> None:
+        while not self.stopped.is_set():
+            try:
+                rows = self.shard_queue.take(self.shard)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to read shard {self.shard} queue: {e}")
+                rows = []
+            for _, payload in rows:
+                try:
+                    self.deliver(payload)
+                except Exception as e:
+                    logger.error(f"Failed to deliver queued update: {e}")
+            if not rows:
+                self.stopped.wait(self.poll_interval)
+
+
+class SharedTokenBucket:
+    """Token bucket kept in SQLite so that several processes share one rate budget.
+
+    Drop-in replacement for broadcaster.TokenBucket.
+    """
+    def __init__(self, path: str, name: str, rate: float, capacity: float = None) -> None:
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.lock = threading.Lock()
+        self.conn = connect(path)
+
+    def _update(self, change) -> float:
+        """Apply change(tokens, updated, now) -> (tokens, updated, wait) in one transaction and return wait."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self.conn.execute(
+                    "SELECT tokens, updated FROM rate_buckets WHERE name = ?", (self.name,)
+                ).fetchone()
+                tokens, updated = row if row else (self.capacity, now)
+                tokens, updated, wait = change(tokens, updated, now)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO rate_buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                    (self.name, tokens, updated),
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """Drain the bucket and refuse tokens for the given number of seconds, in every process."""
+        self._update(lambda tokens, updated, now: (0, max(updated, now + seconds), 0))
+
+    def acquire(self, stop: threading.Event = None) -> bool:
+        """Block until a token is available; return False without one if stop is set first."""
+        while True:
+            wait = self._update(self._take)
+            if not wait:
+                return True
+            if stop is None:
+                time.sleep(wait)
+            elif stop.wait(wait):
+                return False
+
+    def _take(self, tokens: float, updated: float, now: float) -> tuple:
+        if now < updated:
+            return tokens, updated, updated - now
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, now, 0
+        return tokens, now, (1 - tokens) / self.rate
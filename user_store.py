@@ -0,0 +1,202 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from schema import add_missing_columns
+
+logger = logging.getLogger("WarpGeneratorNG")
+
+# last_seen is only written back when it moves by at least this many seconds
+LAST_SEEN_RESOLUTION = 60
+
+# first_seen/last_seen of users imported from the old text file, whose visits are unknown;
+# they match no active= or new= segment, and first_seen stays at this value for good
+UNKNOWN_SEEN = 0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    blocked INTEGER NOT NULL DEFAULT 0,
+    pruned_at REAL,
+    prune_reason TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS users_first_seen ON users (first_seen);
+CREATE INDEX IF NOT EXISTS users_last_seen ON users (last_seen);
+CREATE TABLE IF NOT EXISTS menu_opens (
+    menu TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    opened_at REAL NOT NULL,
+    PRIMARY KEY (menu, user_id)
+) WITHOUT ROWID;
+"""
+
+# Columns added for pruning unreachable users
+USER_COLUMNS = {'pruned_at': 'REAL', 'prune_reason': 'TEXT'}
+
+
+class UserStore:
+    """Users kept in memory and written through to SQLite."""
+    def __init__(self, path: str, legacy_ids_path: str = None) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        add_missing_columns(self.conn, 'users', USER_COLUMNS)
+        self.last_seen = {}
+        self.blocked = set()
+        # (menu, user_id) pairs already recorded, so repeat opens skip the database
+        self.menu_opens = set()
+        self.reload()
+        if not self.last_seen and legacy_ids_path and os.path.exists(legacy_ids_path):
+            self.import_ids(legacy_ids_path)
+
+    def reload(self) -> None:
+        """Reload every user from SQLite, picking up users added by other processes."""
+        last_seen = {}
+        blocked = set()
+        with self.lock:
+            for row in self.conn.execute("SELECT user_id, last_seen, blocked FROM users"):
+                last_seen[row[0]] = row[1]
+                if row[2]:
+                    blocked.add(row[0])
+            self.last_seen, self.blocked = last_seen, blocked
+
+    def __contains__(self, user_id) -> bool:
+        return str(user_id) in self.last_seen
+
+    def __len__(self) -> int:
+        return len(self.last_seen)
+
+    def import_ids(self, path: str) -> None:
+        """Import user IDs from the old append-only text file."""
+        with open(path, 'r') as file:
+            user_ids = {line.strip() for line in file if line.strip()}
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO users (user_id, first_seen, last_seen) VALUES (?, ?, ?)",
+                ((user_id, UNKNOWN_SEEN, UNKNOWN_SEEN) for user_id in user_ids),
+            )
+            for user_id in user_ids:
+                self.last_seen.setdefault(user_id, UNKNOWN_SEEN)
+        logger.info(f"Imported {len(user_ids)} user IDs from {path}")
+
+    def add(self, user_id) -> bool:
+        """Record a visit from a user and return True if the user is new."""
+        user_id = str(user_id)
+        now = time.time()
+        with self.lock:
+            previous = self.last_seen.get(user_id)
+            if previous is None:
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT OR IGNORE INTO users (user_id, first_seen, last_seen) VALUES (?, ?, ?)",
+                        (user_id, now, now),
+                    )
+                self.last_seen[user_id] = now
+                return True
+            self._seen(user_id, previous, now)
+            return False
+
+    def touch(self, user_id) -> None:
+        """Record activity from a known user; only add() registers new users."""
+        user_id = str(user_id)
+        with self.lock:
+            previous = self.last_seen.get(user_id)
+            if previous is not None:
+                self._seen(user_id, previous, time.time())
+
+    def _seen(self, user_id: str, previous: float, now: float) -> None:
+        if now - previous >= LAST_SEEN_RESOLUTION or user_id in self.blocked:
+            # A returning user has evidently unblocked the bot
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE users SET last_seen = ?, blocked = 0, pruned_at = NULL, prune_reason = NULL "
+                    "WHERE user_id = ?",
+                    (now, user_id),
+                )
+            self.last_seen[user_id] = now
+            self.blocked.discard(user_id)
+
+    def set_blocked(self, user_id, blocked: bool = True, reason: str = None) -> bool:
+        """Prune a user that can no longer be reached, or restore one; return True if the flag changed."""
+        user_id = str(user_id)
+        with self.lock:
+            if user_id not in self.last_seen or (user_id in self.blocked) == blocked:
+                return False
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE users SET blocked = ?, pruned_at = ?, prune_reason = ? WHERE user_id = ?",
+                    (int(blocked), time.time() if blocked else None, reason if blocked else None, user_id),
+                )
+            if blocked:
+                self.blocked.add(user_id)
+            else:
+                self.blocked.discard(user_id)
+            return True
+
+    def restore_all(self) -> int:
+        """Clear the pruned flag on every user and return how many were restored."""
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE users SET blocked = 0, pruned_at = NULL, prune_reason = NULL WHERE blocked = 1")
+            restored = len(self.blocked)
+            self.blocked.clear()
+        return restored
+
+    def pruned(self, limit: int = 20) -> List[sqlite3.Row]:
+        """Return the most recently pruned users."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT * FROM users WHERE blocked = 1 ORDER BY pruned_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+
+    def record_menu_open(self, user_id, menu: str) -> None:
+        """Remember that a user opened a menu at least once."""
+        key = (menu, str(user_id))
+        if key in self.menu_opens:
+            return
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO menu_opens (menu, user_id, opened_at) VALUES (?, ?, ?)",
+                    (menu, key[1], time.time()),
+                )
+            self.menu_opens.add(key)
+
+    def segment(self, active_since: float = None, joined_since: float = None, never_opened: str = None) -> List[str]:
+        """Return reachable users matching every given filter, using the indexes instead of a scan where possible.
+
+        last_seen is only accurate to LAST_SEEN_RESOLUTION seconds. Imported users have
+        UNKNOWN_SEEN times, so they only match once they have been seen again.
+        """
+        clauses = ["blocked = 0"]
+        params = []
+        if active_since is not None:
+            clauses.append("last_seen >= ?")
+            params.append(active_since)
+        if joined_since is not None:
+            clauses.append("first_seen >= ?")
+            params.append(joined_since)
+        if never_opened is not None:
+            clauses.append("NOT EXISTS (SELECT 1 FROM menu_opens WHERE menu = ? AND menu_opens.user_id = users.user_id)")
+            params.append(never_opened)
+        with self.lock:
+            rows = self.conn.execute(f"SELECT user_id FROM users WHERE {' AND '.join(clauses)}", params).fetchall()
+        return [row[0] for row in rows]
+
+    def user_ids(self, include_blocked: bool = True) -> List[str]:
+        with self.lock:
+            if include_blocked:
+                return list(self.last_seen)
+            return [user_id for user_id in self.last_seen if user_id not in self.blocked]
+
+    def get(self, user_id) -> Optional[sqlite3.Row]:
+        with self.lock:
+            return self.conn.execute("SELECT * FROM users WHERE user_id = ?", (str(user_id),)).fetchone()
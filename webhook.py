@@ -0,0 +1,75 @@
+import hmac
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telegram import Update
+
+logger = logging.getLogger("WarpGeneratorNG")
+
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """Accepts update POSTs from Telegram and queues them for the dispatcher."""
+    server_version = "WarpGeneratorNG"
+
+    def do_POST(self) -> None:
+        server = self.server
+        if self.path != server.url_path:
+            self.send_error(404)
+            return
+        secret = self.headers.get(SECRET_TOKEN_HEADER, '')
+        if not hmac.compare_digest(secret, server.secret_token):
+            logger.warning(f"Rejected webhook request with a bad secret token from {self.client_address[0]}")
+            self.send_error(403)
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0 or length > MAX_BODY_SIZE:
+            self.send_error(400)
+            return
+        try:
+            data = json.loads(self.rfile.read(length))
+            update = Update.de_json(data, server.bot)
+        except Exception as e:
+            logger.error(f"Failed to parse webhook update: {e}")
+            self.send_error(400)
+            return
+        server.update_queue.put(update)
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(f"Webhook {self.address_string()} {format % args}")
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """Small HTTP server that feeds webhook updates into the dispatcher's update queue.
+
+    Every request must carry secret_token in the secret token header, which Telegram
+    sends when the webhook is registered with it; anything else could forge updates.
+    """
+    # stop() waits for requests in progress so no update is queued after it returns
+    daemon_threads = False
+
+    def __init__(self, bot, update_queue, listen: str, port: int, url_path: str, secret_token: str) -> None:
+        if not secret_token:
+            raise ValueError("A webhook secret token is required")
+        super().__init__((listen, port), WebhookHandler)
+        self.bot = bot
+        self.update_queue = update_queue
+        self.url_path = url_path
+        self.secret_token = secret_token
+        self.thread = None
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.serve_forever, name="webhook", daemon=True)
+        self.thread.start()
+        logger.info(f"Webhook server listening on {self.server_address[0]}:{self.server_address[1]}{self.url_path}")
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,114 @@
+import logging
+import queue
+import threading
+from collections import deque
+from functools import wraps
+from typing import Callable
+
+logger = logging.getLogger("WarpGeneratorNG")
+
+
+def chat_key(update):
+    """Key that serializes updates from the same chat."""
+    if update is not None:
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+    # No chat to order against, so give the update a lane of its own
+    return object()
+
+
+class ChatOrderedPool:
+    """Runs handlers on a bounded thread pool while keeping each chat's updates in order.
+
+    Every key (chat) has a lane of pending tasks and at most one of them runs at
+    a time. Once max_queue tasks are pending, submit() blocks for up to
+    submit_timeout seconds, which holds the dispatcher back from pulling more
+    updates, and then drops the task.
+    """
+    def __init__(self, workers: int = 8, max_queue: int = 1000, submit_timeout: float = 5.0) -> None:
+        self.workers = workers
+        self.max_queue = max_queue
+        self.submit_timeout = submit_timeout
+        self.slots = threading.BoundedSemaphore(max_queue)
+        self.lanes = {}
+        self.ready = queue.Queue()
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.pending = 0
+        self.closed = False
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._work, name=f"handler-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    @property
+    def depth(self) -> int:
+        """Number of tasks waiting or running."""
+        return self.pending
+
+    def submit(self, key, func: Callable, *args, **kwargs) -> bool:
+        """Queue a call behind earlier calls for the same key; return False if it was dropped."""
+        if self.closed:
+            logger.error(f"Handler pool is shut down, dropping update for {key}")
+            return False
+        if not self.slots.acquire(timeout=self.submit_timeout):
+            logger.error(f"Handler queue full ({self.max_queue} pending), dropping update for {key}")
+            return False
+        with self.lock:
+            self.pending += 1
+            lane = self.lanes.get(key)
+            if lane is None:
+                self.lanes[key] = deque([(func, args, kwargs)])
+                self.ready.put(key)
+            else:
+                lane.append((func, args, kwargs))
+        return True
+
+    def shutdown(self, timeout: float = None) -> bool:
+        """Stop accepting tasks, wait up to timeout seconds for queued ones to finish and stop the workers.
+
+        Returns False if tasks were still pending when the timeout ran out.
+        """
+        with self.lock:
+            self.closed = True
+            drained = self.idle.wait_for(lambda: self.pending == 0, timeout)
+        for _ in self.threads:
+            self.ready.put(None)
+        if drained:
+            for thread in self.threads:
+                thread.join()
+        else:
+            logger.warning(f"Handler pool shut down with {self.pending} tasks still pending")
+        return drained
+
+    def wrap(self, handler: Callable) -> Callable:
+        """Wrap a dispatcher callback so it runs on the pool."""
+        @wraps(handler)
+        def wrapper(update, context, *args, **kwargs):
+            self.submit(chat_key(update), handler, update, context, *args, **kwargs)
+        return wrapper
+
+    def _work(self) -> None:
+        while True:
+            key = self.ready.get()
+            if key is None:
+                return
+            with self.lock:
+                func, args, kwargs = self.lanes[key].popleft()
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                logger.exception(f"Handler {getattr(func, '__name__', func)} failed: {e}")
+            finally:
+                with self.lock:
+                    self.pending -= 1
+                    if self.lanes[key]:
+                        self.ready.put(key)
+                    else:
+                        del self.lanes[key]
+                    if not self.pending:
+                        self.idle.notify_all()
+                self.slots.release()